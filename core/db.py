@@ -0,0 +1,59 @@
+import threading
+from typing import Dict
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+
+_warm_up_lock = threading.Lock()
+_warmed_up = False
+
+
+def _default_pool():
+    connection = connections['default']
+    return connection.pool if settings.DB_CONNECTIONS == 'pool' else None
+
+
+def warm_up_connections(timeout: float = 10) -> None:
+    """Abre as conexões do banco antes da primeira requisição do worker"""
+    pool = _default_pool()
+    if pool is not None:
+        # O Django cria o pool fechado; abre e espera chegar a min_size conexões
+        pool.open(wait=True, timeout=timeout)
+    else:
+        connections['default'].ensure_connection()
+
+
+def warm_up_worker() -> None:
+    """warm_up_connections uma única vez por processo"""
+    global _warmed_up
+    with _warm_up_lock:
+        if not _warmed_up:
+            warm_up_connections()
+            _warmed_up = True
+
+
+def warm_up_on_first_request() -> None:
+    """
+    Aquece as conexões na primeira requisição de cada processo. Nada é aberto
+    na importação, então um servidor que carrega a aplicação antes do fork
+    (gunicorn --preload) não passa sockets nem o pool do master aos workers.
+    """
+    request_started.connect(_warm_up_on_request, dispatch_uid='core.db.warm_up')
+
+
+def _warm_up_on_request(**kwargs):
+    request_started.disconnect(dispatch_uid='core.db.warm_up')
+    warm_up_worker()
+
+
+def connection_stats() -> Dict:
+    """Estado das conexões do banco padrão neste processo"""
+    stats = {'mode': settings.DB_CONNECTIONS}
+    pool = _default_pool()
+    if pool is not None:
+        stats.update(pool.get_stats())
+    else:
+        connection = connections['default']
+        stats['connected'] = connection.connection is not None
+        stats['conn_max_age'] = connection.settings_dict['CONN_MAX_AGE']
+    return stats
@@ -0,0 +1,124 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Cookie que mantém no primário as leituras de um cliente que acabou de escrever
+PIN_COOKIE = 'db_primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Só as leituras dentro de replica_reads() podem ir para uma réplica (True
+# para qualquer uma, ou o alias de uma réplica específica)
+_replica_reads = ContextVar('replica_reads', default=False)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+@contextmanager
+def replica_reads(using: Optional[str] = None):
+    """Permite que as consultas de leitura do bloco usem uma réplica (using, se informada)"""
+    token = _replica_reads.set(using or True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pinned_to_primary():
+    """Se há réplicas e as leituras desta requisição precisam ficar no primário"""
+    return bool(settings.DB_REPLICAS) and _pinned_to_primary.get()
+
+
+def primary_wal_lsn() -> str:
+    """Posição atual do WAL no primário; cobre tudo o que já foi confirmado"""
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute('SELECT pg_current_wal_lsn()::text')
+        return cursor.fetchone()[0]
+
+
+def caught_up_replica(lsn: str) -> Optional[str]:
+    """Uma réplica sorteada, se ela já aplicou o WAL até lsn; senão None"""
+    alias = random.choice(settings.DB_REPLICAS)
+    with connections[alias].cursor() as cursor:
+        # NULL (falso) num servidor que não é réplica
+        cursor.execute('SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, false)', [lsn])
+        return alias if cursor.fetchone()[0] else None
+
+
+class PrimaryReplicaRouter:
+    """
+    Escritas (e select_for_update) sempre no primário. Leituras marcadas com
+    replica_reads() vão para uma das DB_REPLICAS, exceto quando o cliente está
+    preso ao primário ou quando já há uma transação aberta no primário.
+    """
+
+    def db_for_read(self, model, **hints):
+        target = _replica_reads.get()
+        if not settings.DB_REPLICAS or not target or _pinned_to_primary.get():
+            return DEFAULT_DB_ALIAS
+        # Dentro de uma transação a leitura precisa enxergar as próprias escritas
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if isinstance(target, str):
+            return target
+        return random.choice(settings.DB_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # As réplicas recebem o schema pela replicação
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryPinningMiddleware:
+    """
+    Prende ao primário as requisições que escrevem e, pelo cookie, as
+    requisições do mesmo cliente nos DB_REPLICA_PIN_SECONDS seguintes, para
+    que ele nunca leia de uma réplica atrasada algo que acabou de gravar.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = _pinned_to_primary.set(self._is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned_to_primary.reset(token)
+        return self._pin(request, response)
+
+    async def __acall__(self, request):
+        token = _pinned_to_primary.set(self._is_pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned_to_primary.reset(token)
+        return self._pin(request, response)
+
+    def _is_pinned(self, request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+    def _pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE,
+                '1',
+                max_age=settings.DB_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
@@ -4,6 +4,17 @@ from rest_framework import status
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import IntegrityError
 from rest_framework.exceptions import ValidationError
+from orders.exceptions.order_exceptions import OrderTooLargeError, PriceNotFoundError
+from products.exceptions.stock_exceptions import (
+    AvailabilityBelowReservedError,
+    IdempotencyKeyReusedError,
+    InsufficientStockError,
+    ProductNotFoundError,
+    ProductsNotFoundError,
+    ReservationNotActiveError,
+    ReservationNotFoundError,
+    StockNotFoundError
+)
 
 def custom_exception_handler(exc, context):
     """
@@ -25,6 +36,90 @@ def custom_exception_handler(exc, context):
             }
             response = Response(data, status=status.HTTP_404_NOT_FOUND)
             
+        elif isinstance(exc, ProductsNotFoundError):
+            data = {
+                'error': {
+                    'type': 'not_found',
+                    'message': str(exc),
+                    'details': {'product_ids': exc.product_ids}
+                }
+            }
+            response = Response(data, status=status.HTTP_404_NOT_FOUND)
+            
+        elif isinstance(exc, (ProductNotFoundError, StockNotFoundError, ReservationNotFoundError)):
+            data = {
+                'error': {
+                    'type': 'not_found',
+                    'message': str(exc),
+                    'details': None
+                }
+            }
+            response = Response(data, status=status.HTTP_404_NOT_FOUND)
+            
+        elif isinstance(exc, InsufficientStockError):
+            data = {
+                'error': {
+                    'type': 'validation_error',
+                    'message': 'Insufficient stock',
+                    'details': str(exc)
+                }
+            }
+            response = Response(data, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            
+        elif isinstance(exc, AvailabilityBelowReservedError):
+            data = {
+                'error': {
+                    'type': 'conflict',
+                    'message': str(exc),
+                    'details': {
+                        'product_id': exc.product_id,
+                        'quantity_in_ml': exc.quantity,
+                        'reserved_in_ml': exc.reserved
+                    }
+                }
+            }
+            response = Response(data, status=status.HTTP_409_CONFLICT)
+            
+        elif isinstance(exc, PriceNotFoundError):
+            data = {
+                'error': {
+                    'type': 'validation_error',
+                    'message': str(exc),
+                    'details': {'product_id': exc.product_id, 'size_ml': exc.size_ml}
+                }
+            }
+            response = Response(data, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            
+        elif isinstance(exc, OrderTooLargeError):
+            data = {
+                'error': {
+                    'type': 'validation_error',
+                    'message': str(exc),
+                    'details': {'field': exc.field, 'limit': exc.limit}
+                }
+            }
+            response = Response(data, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            
+        elif isinstance(exc, ReservationNotActiveError):
+            data = {
+                'error': {
+                    'type': 'conflict',
+                    'message': str(exc),
+                    'details': {'status': exc.status}
+                }
+            }
+            response = Response(data, status=status.HTTP_409_CONFLICT)
+            
+        elif isinstance(exc, IdempotencyKeyReusedError):
+            data = {
+                'error': {
+                    'type': 'conflict',
+                    'message': str(exc),
+                    'details': {'idempotency_key': exc.key}
+                }
+            }
+            response = Response(data, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            
         elif isinstance(exc, IntegrityError):
             data = {
                 'error': {
@@ -0,0 +1,259 @@
+import heapq
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('core.slow_requests')
+
+# Medições da requisição atual; None quando ela não foi sorteada
+_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Tempos acumulados de uma requisição sorteada"""
+
+    def __init__(self, top_queries: int):
+        self.top_queries = top_queries
+        self.query_count = 0
+        self.db = 0.0
+        # Parte de db gasta em instruções com FOR UPDATE (inclui a espera pela trava)
+        self.db_lock = 0.0
+        self.spans = {}
+        self._open_spans = set()
+        self._slowest = []
+
+    def record_query(self, sql: str, duration: float):
+        self.query_count += 1
+        self.db += duration
+        if 'FOR UPDATE' in sql:
+            self.db_lock += duration
+        entry = (duration, self.query_count, sql)
+        if len(self._slowest) < self.top_queries:
+            heapq.heappush(self._slowest, entry)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def merge(self, other: 'RequestTimings'):
+        """Soma as medições de other; spans abertos aqui já contam esse tempo"""
+        self.query_count += other.query_count
+        self.db += other.db
+        self.db_lock += other.db_lock
+        for name, duration in other.spans.items():
+            if name not in self._open_spans:
+                self.spans[name] = self.spans.get(name, 0.0) + duration
+        for duration, _, sql in other._slowest:
+            entry = (duration, -len(self._slowest) - 1, sql)
+            if len(self._slowest) < self.top_queries:
+                heapq.heappush(self._slowest, entry)
+            elif duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def slowest_queries(self):
+        return [
+            {'sql': sql, 'ms': round(duration * 1000, 2)}
+            for duration, _, sql in sorted(self._slowest, reverse=True)
+        ]
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.record_query(sql, time.perf_counter() - started)
+
+
+def _install_wrapper(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _install_wrapper(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+def current_timings():
+    """Medições da requisição atual, ou None se ela não foi sorteada"""
+    return _timings.get()
+
+
+@contextmanager
+def timings_for(targets):
+    """
+    Mede o bloco, que roda em nome das requisições de targets (ex.: numa
+    thread sem o contexto delas), e soma o resultado a cada uma.
+    """
+    targets = [timings for timings in targets if timings is not None]
+    if not targets:
+        yield
+        return
+    collected = RequestTimings(max(timings.top_queries for timings in targets))
+    token = _timings.set(collected)
+    try:
+        yield
+    finally:
+        _timings.reset(token)
+        for timings in targets:
+            timings.merge(collected)
+
+
+@contextmanager
+def span(name: str):
+    """Soma ao tempo de name o bloco, se a requisição foi sorteada; chamadas aninhadas contam uma vez"""
+    timings = _timings.get()
+    if timings is None or name in timings._open_spans:
+        yield
+        return
+    timings._open_spans.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._open_spans.discard(name)
+        timings.spans[name] = timings.spans.get(name, 0.0) + time.perf_counter() - started
+
+
+def timed(name: str):
+    """Decorador de span(name) para funções síncronas e assíncronas"""
+    def decorator(function):
+        if iscoroutinefunction(function):
+            @wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_class(name: str):
+    """Aplica timed(name) aos métodos estáticos públicos da classe"""
+    def decorator(cls):
+        for attribute, value in list(vars(cls).items()):
+            if not attribute.startswith('_') and isinstance(value, staticmethod):
+                setattr(cls, attribute, staticmethod(timed(name)(value.__func__)))
+        return cls
+    return decorator
+
+
+class TimedSerializerMixin:
+    """Soma a validação e a representação do serializer ao span serializer"""
+
+    def run_validation(self, *args, **kwargs):
+        with span('serializer'):
+            return super().run_validation(*args, **kwargs)
+
+    def to_representation(self, *args, **kwargs):
+        with span('serializer'):
+            return super().to_representation(*args, **kwargs)
+
+
+class RequestTimingMiddleware:
+    """
+    Numa fração (SAMPLE_RATE) das requisições, mede consultas, tempo no banco,
+    no StockService e nos serializers e devolve em Server-Timing. Requisições
+    acima de SLOW_MS vão para o log core.slow_requests, com as consultas mais
+    lentas quando foram sorteadas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = settings.REQUEST_TIMING
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # Conexões abertas antes do middleware (ex.: aquecimento) também medem
+        for connection in connections.all(initialized_only=True):
+            _install_wrapper(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timings = self._sample()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timings = self._sample()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    def process_template_response(self, request, response):
+        # Chamado logo antes de response.render() (respostas do DRF e
+        # TemplateResponse); o callback fecha o span depois da renderização
+        timings = _timings.get()
+        if timings is not None:
+            started = time.perf_counter()
+
+            def finish(rendered):
+                timings.spans['render'] = timings.spans.get('render', 0.0) + time.perf_counter() - started
+
+            response.add_post_render_callback(finish)
+        return response
+
+    def _sample(self):
+        if not self.config['ENABLED'] or random.random() >= self.config['SAMPLE_RATE']:
+            return None
+        return RequestTimings(self.config['TOP_QUERIES'])
+
+    def _finish(self, request, response, timings, elapsed):
+        if timings is not None and self.config['SERVER_TIMING']:
+            metrics = [
+                f'db;dur={timings.db * 1000:.1f};desc="{timings.query_count} queries"',
+                f'db-lock;dur={timings.db_lock * 1000:.1f}',
+            ]
+            metrics.extend(
+                f'{name};dur={duration * 1000:.1f}' for name, duration in sorted(timings.spans.items())
+            )
+            metrics.append(f'total;dur={elapsed * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(metrics)
+
+        if self.config['ENABLED'] and elapsed * 1000 >= self.config['SLOW_MS']:
+            entry = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'ms': round(elapsed * 1000, 1),
+                'sampled': timings is not None,
+            }
+            if timings is not None:
+                entry.update({
+                    'queries': timings.query_count,
+                    'db_ms': round(timings.db * 1000, 1),
+                    'db_lock_ms': round(timings.db_lock * 1000, 1),
+                    'spans_ms': {name: round(duration * 1000, 1) for name, duration in timings.spans.items()},
+                    'slowest_queries': timings.slowest_queries(),
+                })
+            logger.warning(json.dumps(entry, ensure_ascii=False), extra={'timing': entry})
+        return response
@@ -0,0 +1,117 @@
+import hashlib
+import json
+from functools import lru_cache
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+# O drf_yasg.generators (e as views de geração ao vivo) só é importado por
+# generate_schema e live_schema_view, isto é, no comando generate_openapi ou
+# com OPENAPI_LIVE ligado.
+
+
+def schema_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Snippets API",
+        default_version='v1',
+        description="Test description",
+        terms_of_service="https://www.google.com/policies/terms/",
+        contact=openapi.Contact(email="contact@snippets.local"),
+        license=openapi.License(name="BSD License"),
+    )
+
+
+def generate_schema() -> bytes:
+    """Gera o schema OpenAPI de todas as views, em JSON"""
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    schema = OpenAPISchemaGenerator(schema_info()).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[], pretty=True).encode(schema)
+
+
+def live_schema_view():
+    """A schema_view do drf_yasg que gera o schema a cada requisição (OPENAPI_LIVE)"""
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+
+    return get_schema_view(
+        schema_info(),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+
+
+@lru_cache(maxsize=None)
+def _load_schema(path: str, mtime: float):
+    with open(path, 'rb') as schema_file:
+        content = schema_file.read()
+    return content, f'"{hashlib.sha256(content).hexdigest()[:32]}"', json.loads(content)['info']['title']
+
+
+def _schema():
+    """Conteúdo, ETag e título do schema gerado; relido só quando o arquivo muda"""
+    path = settings.OPENAPI_SCHEMA_PATH
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    return _load_schema(str(path), mtime)
+
+
+def _missing_schema_response():
+    return JsonResponse(
+        {
+            'error': {
+                'type': 'service_unavailable',
+                'message': 'OpenAPI schema not generated; run python manage.py generate_openapi',
+                'details': None,
+            }
+        },
+        status=503
+    )
+
+
+def openapi_schema(request):
+    """
+    O schema gerado pelo generate_openapi, com ETag.
+    """
+    schema = _schema()
+    if schema is None:
+        return _missing_schema_response()
+    content, etag, _ = schema
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    # Sempre revalida, para que um deploy com schema novo apareça na hora
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _ui(request, template, settings_name):
+    # /swagger/?format=openapi é o endereço do schema na geração ao vivo
+    if request.GET.get('format') == 'openapi':
+        return openapi_schema(request)
+    schema = _schema()
+    if schema is None:
+        return _missing_schema_response()
+    return render(request, template, {
+        'title': schema[2],
+        settings_name: json.dumps({'url': reverse('openapi-schema')}),
+        'oauth2_config': '{}',
+        'USE_SESSION_AUTH': False,
+    })
+
+
+def swagger_ui(request):
+    return _ui(request, 'drf-yasg/swagger-ui.html', 'swagger_settings')
+
+
+def redoc_ui(request):
+    return _ui(request, 'drf-yasg/redoc.html', 'redoc_settings')
@@ -10,22 +10,38 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
+from dotenv import load_dotenv
+
+# Carrega as variáveis de ambiente do arquivo .env
+load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Perfil de execução: 'development' (padrão) ou 'production'. O perfil só muda
+# os padrões; cada valor abaixo ainda pode ser sobrescrito pelo ambiente.
+DJANGO_PROFILE = os.getenv('DJANGO_PROFILE', 'development')
+PRODUCTION = DJANGO_PROFILE == 'production'
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = "django-insecure-&vg+4zm^(xk*xfwu*udfc1^s5*(2*rfq+x3@4a_hu*vq0%l-fe"
+SECRET_KEY = os.getenv('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    if PRODUCTION:
+        raise ImproperlyConfigured("DJANGO_SECRET_KEY is required in the production profile")
+    SECRET_KEY = "django-insecure-&vg+4zm^(xk*xfwu*udfc1^s5*(2*rfq+x3@4a_hu*vq0%l-fe"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Com DEBUG, cada worker também guarda as últimas consultas em connection.queries
+DEBUG = os.getenv('DJANGO_DEBUG', 'False' if PRODUCTION else 'True') == 'True'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.getenv('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -37,15 +53,19 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "drf_yasg",
     "rest_framework",
     "products",
+    "orders",
     "customers",
     "reviews"
 ]
 
 MIDDLEWARE = [
+    "core.instrumentation.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "core.db_router.PrimaryPinningMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -76,12 +96,6 @@ WSGI_APPLICATION = "core.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-import os
-from pathlib import Path
-from dotenv import load_dotenv
-
-# Carrega as variáveis de ambiente do arquivo .env
-load_dotenv()
 
 DATABASES = {
     'default': {
@@ -94,6 +108,117 @@ DATABASES = {
     }
 }
 
+# Como os workers reaproveitam conexões (core.db mostra as estatísticas):
+# - 'pool': pool do psycopg (psycopg_pool) por processo, que testa cada conexão antes de entregá-la
+# - 'persistent': uma conexão por thread mantida por DB_CONN_MAX_AGE segundos
+# - 'none': uma conexão nova por requisição
+DB_CONNECTIONS = os.getenv('DB_CONNECTIONS', 'pool' if PRODUCTION else 'none')
+
+if DB_CONNECTIONS == 'pool':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            # Segundos que uma requisição espera por uma conexão livre
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+        },
+    }
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_CONNECTIONS == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_CONNECTIONS != 'none':
+    raise ImproperlyConfigured("DB_CONNECTIONS must be 'pool', 'persistent' or 'none'")
+
+# Réplicas de leitura (core.db_router): hosts separados por vírgula, com o mesmo
+# usuário e senha do primário e banco DB_REPLICA_NAME (padrão: DB_NAME). Só as
+# leituras marcadas com replica_reads() vão para elas.
+DB_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'NAME': os.getenv('DB_REPLICA_NAME') or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DB_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+
+# Por quantos segundos, depois de uma escrita, as leituras do cliente ficam no primário
+DB_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', '5'))
+
+# Abre as conexões de cada worker antes de ele atender: no post_worker_init do
+# gunicorn (gunicorn.conf.py) ou, em outros servidores, no início da primeira
+# requisição. Nada é aberto na importação de core.wsgi/core.asgi, então
+# gunicorn --preload é seguro.
+DB_WARMUP = os.getenv('DB_WARMUP', 'True' if PRODUCTION else 'False') == 'True'
+
+# Cache do snapshot de produtos disponíveis do dia (products.services.availability_cache)
+# BACKEND 'local' guarda na memória de cada worker; 'django' usa CACHES[ALIAS],
+# que deve ser compartilhado (Redis/Memcached) quando há mais de um worker.
+AVAILABLE_PRODUCTS_CACHE = {
+    'BACKEND': os.getenv('AVAILABLE_PRODUCTS_CACHE_BACKEND', 'local'),
+    'ALIAS': os.getenv('AVAILABLE_PRODUCTS_CACHE_ALIAS', 'default'),
+    'TIMEOUT': int(os.getenv('AVAILABLE_PRODUCTS_CACHE_TIMEOUT', '5')),
+}
+
+# Instrumentação por requisição (core.instrumentation): SAMPLE_RATE das
+# requisições recebem Server-Timing; as acima de SLOW_MS vão para o log
+REQUEST_TIMING = {
+    'ENABLED': os.getenv('REQUEST_TIMING', 'true').lower() == 'true',
+    'SAMPLE_RATE': float(os.getenv('REQUEST_TIMING_SAMPLE_RATE', '0.05' if PRODUCTION else '1')),
+    'SLOW_MS': float(os.getenv('REQUEST_TIMING_SLOW_MS', '500')),
+    'TOP_QUERIES': int(os.getenv('REQUEST_TIMING_TOP_QUERIES', '5')),
+    'SERVER_TIMING': os.getenv('REQUEST_TIMING_SERVER_TIMING', 'true').lower() == 'true',
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.slow_requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# Tempo padrão (em segundos) que uma reserva de estoque segura as quantidades
+STOCK_RESERVATION_TTL_SECONDS = int(os.getenv('STOCK_RESERVATION_TTL_SECONDS', '600'))
+
+# Consumos simultâneos deste processo juntados numa só transação (opt-in;
+# útil com workers WSGI de várias threads; sob ASGI fica desligado, já que as
+# views síncronas rodam uma de cada vez na mesma thread)
+STOCK_CONSUME_BATCHING = {
+    'ENABLED': os.getenv('STOCK_CONSUME_BATCHING', 'false').lower() == 'true',
+    'MAX_WAIT_MS': float(os.getenv('STOCK_CONSUME_BATCH_MAX_WAIT_MS', '5')),
+    'MAX_BATCH_SIZE': int(os.getenv('STOCK_CONSUME_BATCH_MAX_SIZE', '50')),
+}
+
+# Stream de mudanças de estoque (/products/stock/events/). Com BRIDGE=postgres
+# os eventos passam por LISTEN/NOTIFY e chegam aos clientes de todos os workers;
+# com local, só aos conectados no mesmo processo que fez a escrita.
+STOCK_EVENTS = {
+    'BRIDGE': os.getenv('STOCK_EVENTS_BRIDGE', 'local'),
+    'CHANNEL': os.getenv('STOCK_EVENTS_CHANNEL', 'stock_events'),
+    'HEARTBEAT_SECONDS': float(os.getenv('STOCK_EVENTS_HEARTBEAT_SECONDS', '15')),
+    'QUEUE_SIZE': int(os.getenv('STOCK_EVENTS_QUEUE_SIZE', '100')),
+}
+
+# Tempo (em segundos) que a resposta de uma Idempotency-Key fica guardada
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_KEY_TTL_SECONDS', '86400'))
+
+# Dias (contando hoje) mantidos em AvailableProduct pelo archive_availability
+AVAILABILITY_ARCHIVE_DAYS = int(os.getenv('AVAILABILITY_ARCHIVE_DAYS', '90'))
+
+# Schema OpenAPI gerado pelo generate_openapi e servido em /swagger/ e /redoc/.
+# Com OPENAPI_LIVE o drf_yasg volta a gerar o schema a cada requisição.
+OPENAPI_SCHEMA_PATH = Path(os.getenv('OPENAPI_SCHEMA_PATH', BASE_DIR / 'openapi.json'))
+OPENAPI_LIVE = os.getenv('OPENAPI_LIVE', 'false').lower() == 'true'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,27 +1,28 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from .views import api_root
+from .openapi import live_schema_view, openapi_schema, redoc_ui, swagger_ui
+from .views import api_root, db_stats, metrics
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Snippets API",
-      default_version='v1',
-      description="Test description",
-      terms_of_service="https://www.google.com/policies/terms/",
-      contact=openapi.Contact(email="contact@snippets.local"),
-      license=openapi.License(name="BSD License"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
+if settings.OPENAPI_LIVE:
+    schema_view = live_schema_view()
+    schema_urls = [
+        path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+        path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    ]
+else:
+    schema_urls = [
+        path('openapi.json', openapi_schema, name='openapi-schema'),
+        path('swagger/', swagger_ui, name='schema-swagger-ui'),
+        path('redoc/', redoc_ui, name='schema-redoc'),
+    ]
 
 urlpatterns = [
     path('', api_root, name='api-root'),
     path('admin/', admin.site.urls),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('db-stats/', db_stats, name='db-stats'),
+    path('metrics', metrics, name='metrics'),
+    *schema_urls,
     path('products/', include('products.urls')),
+    path('orders/', include('orders.urls')),
 ]
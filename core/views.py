@@ -1,8 +1,12 @@
+from django.http import HttpResponse
 from django.urls import get_resolver
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from collections import OrderedDict
+from products.metrics import metrics_registry
+from .db import connection_stats
 
 @api_view(['GET'])
 def api_root(request):
@@ -13,9 +17,23 @@ def api_root(request):
     
     # URLs da API
     urls['products'] = reverse('product-list', request=request)
+    urls['orders'] = reverse('order-create', request=request)
     
     # URLs de documentação
     urls['swagger'] = reverse('schema-swagger-ui', request=request)
     urls['redoc'] = reverse('schema-redoc', request=request)
     
-    return Response(urls) 
\ No newline at end of file
+    return Response(urls) 
+
+@api_view(['GET'])
+def db_stats(request):
+    """
+    Estatísticas das conexões com o banco (pool ou conexão persistente) deste worker.
+    """
+    return Response(connection_stats())
+
+def metrics(request):
+    """
+    Métricas no formato de texto do Prometheus (somadas entre os workers em modo multiprocesso).
+    """
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,11 @@
+# Configuração lida pelo gunicorn quando iniciado na raiz do projeto
+
+
+def post_worker_init(worker):
+    # Roda em cada worker, depois do fork e com a aplicação carregada (com ou
+    # sem --preload): as conexões ficam prontas antes da primeira requisição
+    from django.conf import settings
+    from core.db import warm_up_worker
+
+    if settings.DB_WARMUP:
+        warm_up_worker()
@@ -0,0 +1,12 @@
+from django.contrib import admin
+from .models import Order, OrderItem
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'reference', 'total_in_cents', 'created_at')
+    search_fields = ('reference',)
+    inlines = [OrderItemInline]
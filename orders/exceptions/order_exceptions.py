@@ -0,0 +1,17 @@
+class OrderException(Exception):
+    """Exceção base para erros relacionados aos pedidos"""
+    pass
+
+class PriceNotFoundError(OrderException):
+    """Exceção lançada quando o produto não tem preço para o tamanho pedido"""
+    def __init__(self, product_id: int, size_ml: int):
+        self.product_id = product_id
+        self.size_ml = size_ml
+        super().__init__(f"Produto {product_id} não tem preço para o tamanho {size_ml}ml")
+
+class OrderTooLargeError(OrderException):
+    """Exceção lançada quando o total em ml ou em centavos passa do limite das colunas"""
+    def __init__(self, field: str, limit: int):
+        self.field = field
+        self.limit = limit
+        super().__init__(f"O pedido passa do limite de {limit} em {field}")
@@ -0,0 +1,26 @@
+from django.db import models
+from products.models import Product
+
+# Create your models here.
+
+class Order(models.Model):
+    """Pedido de um checkout: itens precificados no servidor e estoque consumido na mesma transação"""
+    # Levada para as StockMovement do consumo
+    reference = models.CharField(max_length=64, unique=True)
+    total_in_cents = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Pedido {self.reference}"
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
+    size_ml = models.IntegerField()
+    quantity = models.PositiveIntegerField()
+    # Preço do tamanho no momento do pedido
+    unit_price_in_cents = models.IntegerField()
+    total_in_cents = models.IntegerField()
+    
+    def __str__(self):
+        return f"{self.product_id} - {self.quantity}x {self.size_ml}ml"
@@ -0,0 +1,31 @@
+from rest_framework import serializers
+from core.instrumentation import TimedSerializerMixin
+from products.serializers import MAX_INTEGER
+from .models import Order, OrderItem
+
+class OrderItemInputSerializer(TimedSerializerMixin, serializers.Serializer):
+    product_id = serializers.IntegerField()
+    size_ml = serializers.IntegerField(min_value=1, max_value=MAX_INTEGER)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_INTEGER)
+
+class OrderInputSerializer(TimedSerializerMixin, serializers.Serializer):
+    items = serializers.ListField(
+        child=OrderItemInputSerializer(),
+        min_length=1
+    )
+    # Gerada pelo servidor se não vier; gravada nos movimentos do livro de estoque
+    reference = serializers.CharField(max_length=64, required=False)
+
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    product_id = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = OrderItem
+        fields = ['product_id', 'size_ml', 'quantity', 'unit_price_in_cents', 'total_in_cents']
+
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True)
+    
+    class Meta:
+        model = Order
+        fields = ['id', 'reference', 'total_in_cents', 'created_at', 'items']
@@ -0,0 +1,84 @@
+import uuid
+from typing import Dict, List, Optional, Tuple
+from django.db import transaction
+from products.exceptions.stock_exceptions import ProductsNotFoundError
+from products.models import Product, ProductPrice
+from products.serializers import MAX_INTEGER
+from products.services.stock_service import StockService
+from ..exceptions.order_exceptions import OrderTooLargeError, PriceNotFoundError
+from ..models import Order, OrderItem
+
+
+class OrderService:
+    @staticmethod
+    def price_map(product_ids) -> Dict[Tuple[int, int], int]:
+        """Preço em centavos por (product_id, size_ml), lido de ProductPrice numa consulta"""
+        return {
+            (product_id, size_ml): price_in_cents
+            for product_id, size_ml, price_in_cents in ProductPrice.objects.filter(
+                product_id__in=product_ids
+            ).values_list('product_id', 'size_ml', 'price_in_cents')
+        }
+
+    @staticmethod
+    @transaction.atomic
+    def place_order(items_data: List[Dict], reference: Optional[str] = None) -> Order:
+        """
+        Precifica as linhas (product_id, size_ml, quantity), consome o estoque
+        em ml e grava o pedido, tudo na mesma transação: sem estoque ou sem
+        preço para algum item, nada é gravado.
+        """
+        prices = OrderService.price_map({item['product_id'] for item in items_data})
+
+        missing = [
+            (item['product_id'], item['size_ml']) for item in items_data
+            if (item['product_id'], item['size_ml']) not in prices
+        ]
+        if missing:
+            # Só no caminho de erro: produto inexistente ou tamanho que ele não vende
+            existing = set(
+                Product.objects.filter(id__in={product_id for product_id, _ in missing}).values_list('id', flat=True)
+            )
+            missing_ids = sorted({product_id for product_id, _ in missing if product_id not in existing})
+            if missing_ids:
+                raise ProductsNotFoundError(missing_ids)
+            raise PriceNotFoundError(*missing[0])
+
+        items = [
+            OrderItem(
+                product_id=item['product_id'],
+                size_ml=item['size_ml'],
+                quantity=item['quantity'],
+                unit_price_in_cents=prices[(item['product_id'], item['size_ml'])],
+                total_in_cents=prices[(item['product_id'], item['size_ml'])] * item['quantity']
+            )
+            for item in items_data
+        ]
+        products_data = [
+            {'product_id': item.product_id, 'quantity_in_ml': item.size_ml * item.quantity}
+            for item in items
+        ]
+        total_in_cents = sum(item.total_in_cents for item in items)
+
+        # Quantidades e valores vão para colunas integer; acima do limite o
+        # banco recusaria com DataError
+        ml_by_product = {}
+        for product_data in products_data:
+            product_id = product_data['product_id']
+            ml_by_product[product_id] = ml_by_product.get(product_id, 0) + product_data['quantity_in_ml']
+        if max(ml_by_product.values()) > MAX_INTEGER:
+            raise OrderTooLargeError('quantity_in_ml', MAX_INTEGER)
+        if total_in_cents > MAX_INTEGER:
+            raise OrderTooLargeError('total_in_cents', MAX_INTEGER)
+
+        reference = reference or uuid.uuid4().hex
+        StockService.consume_stock(products_data, reference)
+
+        order = Order.objects.create(
+            reference=reference,
+            total_in_cents=total_in_cents
+        )
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        return order
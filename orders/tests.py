@@ -0,0 +1,109 @@
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from products.models import AvailableProduct, Product, StockMovement
+from products.services.catalog_service import CatalogService
+from products.services.stock_service import StockService
+from .models import Order
+
+PRICES = [
+    {'size_ml': 300, 'price_in_cents': 1200},
+    {'size_ml': 500, 'price_in_cents': 1800},
+]
+
+
+class OrderCreateViewTests(APITestCase):
+    def setUp(self):
+        self.caldo = Product.objects.create(name='Caldo de Feijão', description='', prices=PRICES)
+        self.sopa = Product.objects.create(name='Sopa de Legumes', description='', prices=PRICES)
+        CatalogService.sync_prices([self.caldo, self.sopa])
+        StockService.update_availability([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 2000},
+            {'product_id': self.sopa.pk, 'quantity_in_ml': 600},
+        ])
+
+    def place(self, items, **extra):
+        return self.client.post(reverse('order-create'), {'items': items}, format='json', **extra)
+
+    def available(self, product):
+        return AvailableProduct.objects.get(product=product).quantity_in_ml
+
+    def test_prices_each_item_from_the_catalog(self):
+        response = self.place([
+            {'product_id': self.caldo.pk, 'size_ml': 500, 'quantity': 2},
+            {'product_id': self.sopa.pk, 'size_ml': 300, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_in_cents'], 2 * 1800 + 1200)
+        self.assertEqual(
+            [(item['unit_price_in_cents'], item['total_in_cents']) for item in response.data['items']],
+            [(1800, 3600), (1200, 1200)]
+        )
+
+    def test_consumes_size_times_quantity_summed_per_product(self):
+        response = self.place([
+            {'product_id': self.caldo.pk, 'size_ml': 500, 'quantity': 2},
+            {'product_id': self.sopa.pk, 'size_ml': 300, 'quantity': 1},
+            {'product_id': self.caldo.pk, 'size_ml': 300, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.available(self.caldo), 2000 - 1300)
+        self.assertEqual(self.available(self.sopa), 600 - 300)
+        self.assertEqual(
+            sorted(
+                StockMovement.objects.filter(
+                    order_reference=response.data['reference'], kind=StockMovement.CONSUME
+                ).values_list('product_id', 'quantity_in_ml')
+            ),
+            sorted([(self.caldo.pk, -1300), (self.sopa.pk, -300)])
+        )
+
+    def test_insufficient_stock_rolls_back_the_whole_order(self):
+        response = self.client.post(reverse('order-create'), {
+            'items': [
+                {'product_id': self.caldo.pk, 'size_ml': 500, 'quantity': 1},
+                {'product_id': self.sopa.pk, 'size_ml': 500, 'quantity': 2},
+            ],
+            'reference': 'pedido-sem-estoque',
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertIn(f'Produto {self.sopa.pk} ', response.data['error']['details'])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(StockMovement.objects.filter(order_reference='pedido-sem-estoque').exists())
+        self.assertEqual(self.available(self.caldo), 2000)
+        self.assertEqual(self.available(self.sopa), 600)
+
+    def test_unknown_size_rolls_back_the_whole_order(self):
+        response = self.place([
+            {'product_id': self.caldo.pk, 'size_ml': 500, 'quantity': 1},
+            {'product_id': self.sopa.pk, 'size_ml': 700, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(StockMovement.objects.filter(kind=StockMovement.CONSUME).exists())
+        self.assertEqual(self.available(self.caldo), 2000)
+
+    def test_unknown_product_returns_404(self):
+        unknown_id = self.sopa.pk + 1000
+        response = self.place([{'product_id': unknown_id, 'size_ml': 300, 'quantity': 1}])
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['error']['details']['product_ids'], [unknown_id])
+        self.assertFalse(Order.objects.exists())
+
+    def test_idempotency_key_replays_the_first_response(self):
+        items = [{'product_id': self.caldo.pk, 'size_ml': 300, 'quantity': 1}]
+
+        first = self.place(items, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        retry = self.place(items, HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.available(self.caldo), 2000 - 300)
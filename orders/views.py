@@ -0,0 +1,85 @@
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from products.services.idempotency_service import IdempotencyService
+from .models import Order
+from .serializers import OrderInputSerializer, OrderSerializer
+from .services.order_service import OrderService
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class OrderCreateView(APIView):
+    parser_classes = [JSONParser]
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_description=(
+            "Place an order: prices each line (product, size, quantity) from the catalog "
+            "and consumes the stock in the same transaction. With an Idempotency-Key "
+            "header, retries get the stored response of the first execution."
+        ),
+        request_body=OrderInputSerializer,
+        manual_parameters=[
+            openapi.Parameter(
+                'Idempotency-Key',
+                openapi.IN_HEADER,
+                description="Unique key per checkout, reused on retries",
+                type=openapi.TYPE_STRING,
+                required=False
+            )
+        ],
+        responses={
+            201: OrderSerializer,
+            400: openapi.Response(description="Bad Request"),
+            404: openapi.Response(description="Product or stock not found"),
+            422: openapi.Response(description="Insufficient stock or size not sold for the product")
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        # Mesma regra de Idempotency-Key do consumo de estoque
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return self._place(request)
+        if not 0 < len(key) <= 255:
+            raise ValidationError({'Idempotency-Key': ['Idempotency-Key must have 1 to 255 characters']})
+        return IdempotencyService.execute(
+            key,
+            IdempotencyService.fingerprint(request),
+            lambda: self._place(request),
+            self.handle_exception
+        )
+    
+    def _place(self, request):
+        input_serializer = OrderInputSerializer(data=request.data)
+        input_serializer.is_valid(raise_exception=True)
+        
+        order = OrderService.place_order(
+            input_serializer.validated_data['items'],
+            input_serializer.validated_data.get('reference')
+        )
+        
+        serializer = OrderSerializer(order)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class OrderDetailView(APIView):
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_description="Retrieve an order with its items",
+        responses={
+            200: OrderSerializer,
+            404: openapi.Response(description="Order not found")
+        }
+    )
+    def get(self, request, order_id, *args, **kwargs):
+        order = get_object_or_404(Order.objects.prefetch_related('items'), pk=order_id)
+        return Response(OrderSerializer(order).data)
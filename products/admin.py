@@ -1,7 +1,21 @@
 from django.contrib import admin
 from .models import Product
+from .services.catalog_service import CatalogService
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name')
+    list_display = ('id', 'name', 'stock_slots')
     search_fields = ('name', 'description')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        CatalogService.sync_prices([obj])
+        CatalogService.bump_version()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        CatalogService.bump_version()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        CatalogService.bump_version()
@@ -0,0 +1,104 @@
+import asyncio
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from core.db_router import replica_reads
+from .models import Product
+from .serializers import AvailableProductOutputSerializer, ProductSerializer
+from .services.catalog_service import CatalogService
+from .services.stock_events import RESYNC, encode_changes, encode_event, subscribe
+from .services.stock_service import StockService
+from .views import catalog_conditional_response
+
+
+class AsyncAvailableProductsView(View):
+    """
+    Produtos disponíveis hoje pelo ORM assíncrono. Sob ASGI a espera pelo
+    banco não ocupa uma thread, então um worker atende muitos clientes que
+    consultam o estoque periodicamente.
+    """
+    http_method_names = ['get']
+
+    async def get(self, request, *args, **kwargs):
+        return JsonResponse(await StockService.aget_available_products_payload())
+
+
+class AsyncProductDetailView(View):
+    """Detalhe de um produto pelo ORM assíncrono, com o mesmo 304 de /products/<id>/"""
+    http_method_names = ['get']
+
+    async def get(self, request, pk, *args, **kwargs):
+        with replica_reads():
+            headers, response = catalog_conditional_response(request, *await CatalogService.aget_version())
+            if response is None:
+                try:
+                    product = await Product.objects.aget(pk=pk)
+                except Product.DoesNotExist:
+                    # Mesmo corpo que o custom_exception_handler gera para o 404 da rota síncrona
+                    return JsonResponse({
+                        'error': {
+                            'type': 'validation_error',
+                            'message': 'Invalid input data',
+                            'details': {'detail': 'No Product matches the given query.'}
+                        }
+                    }, status=404)
+                response = JsonResponse(ProductSerializer(product).data)
+
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+
+class StockEventsView(View):
+    """
+    Server-Sent Events com as mudanças do saldo livre de hoje: um snapshot na
+    conexão e depois availability/sold_out a cada escrita confirmada. Uma
+    conexão por tela substitui o polling de /products/available-products/.
+    Só funciona sob ASGI.
+    """
+    http_method_names = ['get']
+
+    async def get(self, request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({
+                'error': {
+                    'type': 'internal_error',
+                    'message': 'Stock events require an ASGI server',
+                    'details': None
+                }
+            }, status=501)
+
+        heartbeat = settings.STOCK_EVENTS['HEARTBEAT_SECONDS']
+
+        async def stream():
+            # Assina só quando o corpo começa a sair (um stream que nunca
+            # começa não deixa assinatura para trás) e antes do snapshot, para
+            # não perder o que mudar no meio
+            subscription = subscribe()
+            try:
+                yield b'retry: 3000\n\n'
+                yield await self._snapshot()
+                while True:
+                    try:
+                        item = await subscription.get(heartbeat)
+                    except asyncio.TimeoutError:
+                        # Comentário SSE: mantém a conexão viva em proxies
+                        yield b': keepalive\n\n'
+                        continue
+                    yield await self._snapshot() if item is RESYNC else encode_changes(item)
+            finally:
+                subscription.close()
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def _snapshot(self):
+        # Direto do primário e sem o cache de disponibilidade, que pode estar
+        # atrás dos eventos
+        payload = AvailableProductOutputSerializer(
+            {'products': await StockService.aget_available_products()}
+        ).data
+        return encode_event('snapshot', payload)
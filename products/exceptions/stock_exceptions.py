@@ -13,14 +13,54 @@ class InsufficientStockError(StockException):
             f"Disponível: {available}ml, Solicitado: {requested}ml"
         )
 
+class AvailabilityBelowReservedError(StockException):
+    """Exceção lançada quando a nova disponibilidade fica abaixo das reservas ativas"""
+    def __init__(self, product_id: int, quantity: int, reserved: int):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.reserved = reserved
+        super().__init__(
+            f"Disponibilidade do produto {product_id} não pode ficar abaixo do reservado. "
+            f"Nova quantidade: {quantity}ml, Reservado: {reserved}ml"
+        )
+
 class ProductNotFoundError(StockException):
     """Exceção lançada quando o produto não é encontrado"""
     def __init__(self, product_id: int):
         self.product_id = product_id
         super().__init__(f"Produto com id {product_id} não encontrado")
 
+class ProductsNotFoundError(ProductNotFoundError):
+    """Exceção lançada quando um ou mais produtos de um lote não são encontrados"""
+    def __init__(self, product_ids: list):
+        self.product_ids = product_ids
+        self.product_id = product_ids[0]
+        StockException.__init__(
+            self,
+            f"Produtos com ids {', '.join(str(product_id) for product_id in product_ids)} não encontrados"
+        )
+
 class StockNotFoundError(StockException):
     """Exceção lançada quando não há registro de estoque para o produto"""
     def __init__(self, product_id: int):
         self.product_id = product_id
-        super().__init__(f"Não há estoque disponível para o produto {product_id}") 
\ No newline at end of file
+        super().__init__(f"Não há estoque disponível para o produto {product_id}")
+
+class ReservationNotFoundError(StockException):
+    """Exceção lançada quando a reserva não é encontrada"""
+    def __init__(self, reservation_id: int):
+        self.reservation_id = reservation_id
+        super().__init__(f"Reserva {reservation_id} não encontrada")
+
+class ReservationNotActiveError(StockException):
+    """Exceção lançada ao confirmar ou liberar uma reserva que não está mais ativa"""
+    def __init__(self, reservation_id: int, status: str):
+        self.reservation_id = reservation_id
+        self.status = status
+        super().__init__(f"Reserva {reservation_id} não está ativa (status: {status})")
+
+class IdempotencyKeyReusedError(StockException):
+    """Exceção lançada quando uma Idempotency-Key é repetida com outra requisição"""
+    def __init__(self, key: str):
+        self.key = key
+        super().__init__(f"Idempotency-Key {key} já foi usada com outra requisição")
@@ -0,0 +1,51 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from products.models import AvailableProduct
+from products.services.stock_service import StockService
+
+
+class Command(BaseCommand):
+    help = (
+        "Move para AvailableProductArchive os dias de disponibilidade mais "
+        "antigos que o horizonte, em lotes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.AVAILABILITY_ARCHIVE_DAYS,
+            help="Dias mantidos em AvailableProduct, contando hoje"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Quantidade máxima de linhas movidas por transação"
+        )
+        parser.add_argument(
+            '--vacuum',
+            action='store_true',
+            help="Roda VACUUM ANALYZE na tabela ao final, para as leituras voltarem a ser só pelo índice"
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError("--days precisa ser pelo menos 1 (o dia de hoje nunca é arquivado)")
+
+        before = timezone.now().date() - timedelta(days=options['days'] - 1)
+        total = 0
+        while True:
+            moved = StockService.archive_availability(before, options['batch_size'])
+            if not moved:
+                break
+            total += moved
+
+        if options['vacuum']:
+            with connection.cursor() as cursor:
+                cursor.execute(f'VACUUM ANALYZE {connection.ops.quote_name(AvailableProduct._meta.db_table)}')
+
+        self.stdout.write(self.style.SUCCESS(f"{total} dias de disponibilidade arquivados (anteriores a {before})"))
@@ -0,0 +1,328 @@
+import json
+import multiprocessing
+import random
+import statistics
+import subprocess
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.test import Client
+from django.utils import timezone
+from products.models import AvailableProduct, Product, StockMovement
+from products.services.catalog_service import CatalogService
+from products.services.consume_batcher import get_consume_batcher
+from products.services.stock_service import StockService
+
+SCENARIOS = ('consume', 'update_availability', 'catalog', 'available_products')
+BENCHMARK_NAME = 'benchmark-api'
+
+
+def _request(client, scenario, hot_ids, quantity, rng):
+    """Uma requisição do cenário pelas views de verdade; devolve o status"""
+    if scenario == 'consume':
+        return client.post(
+            '/products/stock/consume/',
+            {'products': [{'product_id': rng.choice(hot_ids), 'quantity_in_ml': quantity}]},
+            content_type='application/json'
+        ).status_code
+    if scenario == 'update_availability':
+        return client.post(
+            '/products/available-products/',
+            {'products': [{'product_id': rng.choice(hot_ids), 'quantity_in_ml': rng.randint(1, 100) * quantity}]},
+            content_type='application/json'
+        ).status_code
+    if scenario == 'catalog':
+        return client.get('/products/', {'page_size': 50, 'name': BENCHMARK_NAME}).status_code
+    return client.get('/products/available-products/').status_code
+
+
+def _worker(barrier, results, scenario, threads, requests, hot_ids, quantity, seed):
+    samples = []
+    statuses = {}
+    lock = threading.Lock()
+    thread_barrier = threading.Barrier(threads + 1)
+
+    def run(thread_seed):
+        rng = random.Random(thread_seed)
+        client = Client()
+        local_samples = []
+        local_statuses = {}
+        try:
+            thread_barrier.wait()
+            for _ in range(requests):
+                started = time.perf_counter()
+                status_code = _request(client, scenario, hot_ids, quantity, rng)
+                local_samples.append(time.perf_counter() - started)
+                local_statuses[status_code] = local_statuses.get(status_code, 0) + 1
+        finally:
+            connections.close_all()
+            with lock:
+                samples.extend(local_samples)
+                for status_code, count in local_statuses.items():
+                    statuses[status_code] = statuses.get(status_code, 0) + count
+
+    pool = [threading.Thread(target=run, args=(seed * 1000 + index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    try:
+        barrier.wait()
+        thread_barrier.wait()
+        for thread in pool:
+            thread.join()
+    finally:
+        connections.close_all()
+        results.put((samples, statuses))
+
+
+def _percentile(sorted_samples, fraction):
+    index = min(int(round(fraction * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index] * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga nas views de estoque e catálogo com vários processos e threads: "
+        "vazão, p50/p95/p99 e a checagem de que o consumo nunca passa do estoque. "
+        "Cria (e remove ao final) produtos no banco configurado; com DEBUG "
+        "desligado só roda com --allow-writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=SCENARIOS,
+            help="Cenário a rodar (repetível; padrão: todos)"
+        )
+        parser.add_argument('--processes', type=int, default=4, help="Processos por cenário")
+        parser.add_argument('--threads', type=int, default=4, help="Threads por processo")
+        parser.add_argument('--requests', type=int, default=100, help="Requisições por thread")
+        parser.add_argument('--hot-products', type=int, default=3, help="Produtos disputados pelas escritas")
+        parser.add_argument('--slots', type=int, default=1, help="stock_slots dos produtos disputados")
+        parser.add_argument('--catalog-size', type=int, default=200, help="Produtos criados para o catálogo")
+        parser.add_argument('--quantity', type=int, default=10, help="ml por consumo")
+        parser.add_argument(
+            '--stock-ratio',
+            type=float,
+            default=0.8,
+            help="Estoque inicial do consumo como fração da demanda total (abaixo de 1 força recusas)"
+        )
+        parser.add_argument('--batching', action='store_true', help="Liga o batcher de consumo nos workers")
+        parser.add_argument(
+            '--allow-writes',
+            action='store_true',
+            help="Roda com DEBUG desligado, gravando e apagando produtos no banco configurado"
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Grava os resultados em JSON neste arquivo")
+        parser.add_argument('--compare', help="JSON de uma execução anterior para apontar regressões")
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.15,
+            help="Queda de vazão ou alta de p95 tolerada na comparação (fração)"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("O benchmark precisa de PostgreSQL")
+        # Sem DEBUG o banco pode ser o de produção
+        if not settings.DEBUG and not options['allow_writes']:
+            raise CommandError(
+                f"O benchmark cria e apaga produtos em {connection.settings_dict['NAME']}; "
+                "com DEBUG desligado, confirme com --allow-writes"
+            )
+        if settings.DEBUG:
+            self.stderr.write(self.style.WARNING(
+                "DEBUG ligado: cada worker guarda as consultas em connection.queries e os números pioram"
+            ))
+
+        # O Client das threads se apresenta como testserver
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        if options['batching']:
+            settings.STOCK_CONSUME_BATCHING = {**settings.STOCK_CONSUME_BATCHING, 'ENABLED': True}
+            get_consume_batcher.cache_clear()
+
+        hot_products, catalog = [], []
+        try:
+            hot_products, catalog = self._create_products(options)
+            scenarios = {
+                scenario: self._run(scenario, [product.pk for product in hot_products], options)
+                for scenario in options['scenario'] or SCENARIOS
+            }
+        finally:
+            # Estoque, livro e rollups dos produtos saem junto (CASCADE)
+            created_ids = [product.pk for product in hot_products + catalog]
+            if created_ids:
+                Product.objects.filter(pk__in=created_ids).delete()
+                CatalogService.bump_version()
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'git_commit': self._git_commit(),
+            'database': {'vendor': connection.vendor, 'version': connection.pg_version},
+            'debug': settings.DEBUG,
+            'config': {
+                name: options[name]
+                for name in (
+                    'processes', 'threads', 'requests', 'hot_products', 'slots',
+                    'catalog_size', 'quantity', 'stock_ratio', 'batching', 'seed'
+                )
+            },
+            'scenarios': scenarios,
+        }
+
+        for scenario, result in scenarios.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{scenario}: {result['requests']} req em {result['elapsed_s']:.2f}s "
+                f"({result['throughput_rps']:.0f}/s), p50 {latency['p50']:.1f}ms "
+                f"p95 {latency['p95']:.1f}ms p99 {latency['p99']:.1f}ms, status {result['statuses']}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"resultados gravados em {options['output']}")
+
+        broken = [scenario for scenario, result in scenarios.items() if not result.get('invariant', {}).get('ok', True)]
+        if broken:
+            raise CommandError(f"invariante do estoque violada em: {', '.join(broken)}")
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                regressions = self._regressions(json.load(baseline_file), report, options['tolerance'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressões em relação a {options['compare']}")
+            self.stdout.write(self.style.SUCCESS(f"sem regressões em relação a {options['compare']}"))
+
+    @transaction.atomic
+    def _create_products(self, options):
+        """Produtos disputados e de catálogo, criados por inteiro ou não criados"""
+        prices = [{'size_ml': 500, 'price_in_cents': 1500}, {'size_ml': 1000, 'price_in_cents': 2500}]
+        hot_products = Product.objects.bulk_create([
+            Product(name=f'{BENCHMARK_NAME}-hot-{index}', description='', prices=prices, stock_slots=options['slots'])
+            for index in range(options['hot_products'])
+        ])
+        catalog = Product.objects.bulk_create([
+            Product(name=f'{BENCHMARK_NAME}-{index}', description='', prices=prices)
+            for index in range(options['catalog_size'])
+        ])
+        CatalogService.sync_prices(hot_products + catalog)
+        CatalogService.bump_version()
+        return hot_products, catalog
+
+    def _run(self, scenario, hot_ids, options):
+        processes, threads, requests = options['processes'], options['threads'], options['requests']
+        total = processes * threads * requests
+        # Demanda de cada produto disputado, com folga para a escolha aleatória
+        initial = int(total * options['quantity'] * options['stock_ratio'] / len(hot_ids))
+        StockService.update_availability([
+            {'product_id': product_id, 'quantity_in_ml': initial} for product_id in hot_ids
+        ])
+        ledger_before = self._ledger(hot_ids)
+
+        # Processos para fugir do GIL; threads para muitas conexões por processo
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(processes + 1)
+        results = context.Queue()
+        connections.close_all()
+        workers = [
+            context.Process(
+                target=_worker,
+                args=(
+                    barrier, results, scenario, threads, requests, hot_ids,
+                    options['quantity'], options['seed'] * 100 + index
+                )
+            )
+            for index in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        samples, statuses = [], {}
+        for _ in workers:
+            worker_samples, worker_statuses = results.get()
+            samples.extend(worker_samples)
+            for status_code, count in worker_statuses.items():
+                statuses[status_code] = statuses.get(status_code, 0) + count
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+
+        samples.sort()
+        result = {
+            'requests': len(samples),
+            'statuses': {str(status_code): count for status_code, count in sorted(statuses.items())},
+            'elapsed_s': elapsed,
+            'throughput_rps': len(samples) / elapsed,
+            'latency_ms': {
+                'mean': statistics.fmean(samples) * 1000,
+                'p50': _percentile(samples, 0.50),
+                'p95': _percentile(samples, 0.95),
+                'p99': _percentile(samples, 0.99),
+                'max': samples[-1] * 1000,
+            },
+        }
+        if scenario == 'consume':
+            result['invariant'] = self._check_consume(hot_ids, initial, statuses.get(200, 0), options['quantity'], ledger_before)
+        return result
+
+    def _ledger(self, hot_ids):
+        return StockMovement.objects.filter(
+            product_id__in=hot_ids,
+            kind=StockMovement.CONSUME
+        ).aggregate(total=Sum('quantity_in_ml'))['total'] or 0
+
+    def _check_consume(self, hot_ids, initial, accepted, quantity, ledger_before):
+        """Nada consumido além do estoque, e saldo, respostas 200 e livro batem"""
+        remaining = sum(
+            available_product.available_in_ml
+            for available_product in AvailableProduct.objects.filter(
+                product_id__in=hot_ids,
+                date=timezone.now().date()
+            ).with_slot_totals()
+        )
+        stock = initial * len(hot_ids)
+        consumed = stock - remaining
+        ledger = ledger_before - self._ledger(hot_ids)
+        return {
+            'stock_ml': stock,
+            'consumed_ml': consumed,
+            'accepted_ml': accepted * quantity,
+            'ledger_ml': ledger,
+            'ok': remaining >= 0 and consumed == accepted * quantity == ledger,
+        }
+
+    def _regressions(self, baseline, report, tolerance):
+        regressions = []
+        for scenario, result in report['scenarios'].items():
+            previous = baseline.get('scenarios', {}).get(scenario)
+            if previous is None:
+                continue
+            if result['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+                regressions.append(
+                    f"{scenario}: vazão {result['throughput_rps']:.0f}/s abaixo de {previous['throughput_rps']:.0f}/s"
+                )
+            if result['latency_ms']['p95'] > previous['latency_ms']['p95'] * (1 + tolerance):
+                regressions.append(
+                    f"{scenario}: p95 {result['latency_ms']['p95']:.1f}ms acima de {previous['latency_ms']['p95']:.1f}ms"
+                )
+        return regressions
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
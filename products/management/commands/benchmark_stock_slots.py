@@ -0,0 +1,119 @@
+import multiprocessing
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from products.models import Product, AvailableProduct
+from products.services.stock_service import StockService
+from products.exceptions.stock_exceptions import InsufficientStockError
+
+
+def _consume(barrier, results, product_id, orders, quantity, hold_seconds):
+    consumed = 0
+    try:
+        barrier.wait()
+        for _ in range(orders):
+            try:
+                with transaction.atomic():
+                    StockService.consume_stock([{'product_id': product_id, 'quantity_in_ml': quantity}])
+                    # Simula o restante do checkout (ou a latência até o banco)
+                    # com as travas ainda seguras
+                    if hold_seconds:
+                        time.sleep(hold_seconds)
+                consumed += 1
+            except InsufficientStockError:
+                pass
+    finally:
+        connections.close_all()
+        results.put(consumed)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a vazão de consumos simultâneos de um mesmo produto com e sem "
+        "sharding. Cria (e remove ao final) um produto no banco configurado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=16, help="Consumidores simultâneos")
+        parser.add_argument('--orders', type=int, default=200, help="Consumos por consumidor")
+        parser.add_argument('--slots', type=int, default=8, help="Slots do modo com sharding")
+        parser.add_argument('--quantity', type=int, default=10, help="ml por consumo")
+        parser.add_argument(
+            '--hold-ms',
+            type=float,
+            default=1.0,
+            help="Tempo que cada transação continua aberta depois de consumir"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("O benchmark precisa de PostgreSQL")
+
+        product = Product.objects.create(name='benchmark-stock-slots', description='', prices=[])
+        try:
+            results = [
+                self._run(
+                    product,
+                    slots,
+                    options['processes'],
+                    options['orders'],
+                    options['quantity'],
+                    options['hold_ms'] / 1000
+                )
+                for slots in (1, options['slots'])
+            ]
+        finally:
+            product.delete()
+
+        for result in results:
+            self.stdout.write(
+                f"slots={result['slots']}: {result['consumed']} consumos em {result['elapsed']:.2f}s "
+                f"({result['throughput']:.0f}/s), saldo final {result['remaining']}ml"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"ganho com sharding: {results[1]['throughput'] / results[0]['throughput']:.2f}x"
+        ))
+
+    def _run(self, product, slots, processes, orders, quantity, hold_seconds):
+        Product.objects.filter(pk=product.pk).update(stock_slots=slots)
+        initial = processes * orders * quantity
+        StockService.update_availability([{'product_id': product.pk, 'quantity_in_ml': initial}])
+
+        # Processos separados para que a disputa medida seja a das travas no
+        # banco, e não a do GIL
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(processes + 1)
+        results = context.Queue()
+        connections.close_all()
+
+        workers = [
+            context.Process(target=_consume, args=(barrier, results, product.pk, orders, quantity, hold_seconds))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        total_consumed = sum(results.get() for _ in workers)
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+
+        remaining = AvailableProduct.objects.filter(
+            product=product,
+            date=timezone.now().date()
+        ).with_slot_totals().get().available_in_ml
+        if remaining != initial - total_consumed * quantity:
+            raise CommandError(
+                f"slots={slots}: saldo {remaining}ml não bate com "
+                f"{initial}ml - {total_consumed} x {quantity}ml"
+            )
+
+        return {
+            'slots': slots,
+            'consumed': total_consumed,
+            'elapsed': elapsed,
+            'throughput': total_consumed / elapsed,
+            'remaining': remaining,
+        }
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from products.services.stock_service import StockService
+
+
+class Command(BaseCommand):
+    help = "Devolve ao estoque as reservas ativas que já venceram"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Quantidade máxima de reservas expiradas por transação"
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            expired = StockService.expire_reservations(options['batch_size'])
+            if not expired:
+                break
+            total += expired
+
+        self.stdout.write(self.style.SUCCESS(f"{total} reservas expiradas"))
@@ -0,0 +1,45 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from products.services.export_service import CHUNK_SIZE, ExportService
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta o catálogo ou o histórico de disponibilidade em NDJSON ou CSV, "
+        "lendo por um cursor do servidor, com memória constante"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=['products', 'availability'])
+        parser.add_argument(
+            '--format',
+            dest='export_format',
+            choices=list(ExportService.FORMATS),
+            default='ndjson'
+        )
+        parser.add_argument('--start', type=date.fromisoformat, help="Primeira data do histórico (YYYY-MM-DD)")
+        parser.add_argument('--end', type=date.fromisoformat, help="Última data do histórico (YYYY-MM-DD)")
+        parser.add_argument('--output', help="Arquivo de saída (padrão: saída padrão)")
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help="Linhas buscadas por ida ao cursor"
+        )
+
+    def handle(self, *args, **options):
+        if options['dataset'] == 'products':
+            rows = ExportService.product_rows(options['chunk_size'])
+            fields = ExportService.PRODUCT_FIELDS
+        else:
+            rows = ExportService.availability_rows(options['start'], options['end'], options['chunk_size'])
+            fields = ExportService.AVAILABILITY_FIELDS
+
+        chunks = ExportService.render(rows, fields, options['export_format'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
@@ -0,0 +1,34 @@
+import os
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.openapi import generate_schema
+
+
+class Command(BaseCommand):
+    help = "Gera o schema OpenAPI servido em /swagger/ e /redoc/ (rodar no build ou no deploy)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Arquivo de saída (padrão: settings.OPENAPI_SCHEMA_PATH)")
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Não grava; falha se o arquivo estiver ausente ou desatualizado"
+        )
+
+    def handle(self, *args, **options):
+        output = Path(options['output'] or settings.OPENAPI_SCHEMA_PATH)
+        content = generate_schema()
+
+        if options['check']:
+            if not output.exists() or output.read_bytes() != content:
+                raise CommandError(f"{output} desatualizado; rode python manage.py generate_openapi")
+            self.stdout.write(self.style.SUCCESS(f"{output} atualizado"))
+            return
+
+        # Grava ao lado e troca, para nunca servir um arquivo pela metade
+        output.parent.mkdir(parents=True, exist_ok=True)
+        partial = output.with_name(f'.{output.name}.tmp')
+        partial.write_bytes(content)
+        os.replace(partial, output)
+        self.stdout.write(self.style.SUCCESS(f"schema gravado em {output} ({len(content)} bytes)"))
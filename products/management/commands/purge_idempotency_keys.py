@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from products.services.idempotency_service import IdempotencyService
+
+
+class Command(BaseCommand):
+    help = "Apaga as respostas de Idempotency-Key já vencidas"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Quantidade máxima de chaves apagadas por vez"
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            purged = IdempotencyService.purge_expired(options['batch_size'])
+            if not purged:
+                break
+            total += purged
+
+        self.stdout.write(self.style.SUCCESS(f"{total} chaves vencidas apagadas"))
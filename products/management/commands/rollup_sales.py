@@ -0,0 +1,45 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from products.services.sales_report_service import SalesReportService, day_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os rollups de vendas por hora e por dia a partir do livro de "
+        "estoque (rodar periodicamente; --since reconstrói o histórico)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=2,
+            help="Horas anteriores à corrente recalculadas em cada execução"
+        )
+        parser.add_argument(
+            '--since',
+            type=date.fromisoformat,
+            help="Reconstrói a partir desta data (YYYY-MM-DD), um dia por transação"
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options['since'] is None:
+            if options['hours'] < 0:
+                raise CommandError("--hours não pode ser negativo")
+            totals = SalesReportService.rollup(now - timedelta(hours=options['hours']), now)
+            self.stdout.write(self.style.SUCCESS(f"{totals['hours']} horas e {totals['days']} dias recalculados"))
+            return
+
+        hours = days = 0
+        day = options['since']
+        today = timezone.localdate(now)
+        while day <= today:
+            # O fim do dia cai na última hora dele, para não recalcular o dia seguinte
+            until = min(day_start(day + timedelta(days=1)) - timedelta(hours=1), now)
+            totals = SalesReportService.rollup(day_start(day), until)
+            hours += totals['hours']
+            days += totals['days']
+            day += timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"{hours} horas e {days} dias recalculados"))
@@ -0,0 +1,125 @@
+import os
+import time
+from functools import wraps
+from django.db import connection
+from django.utils import timezone
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from .exceptions.stock_exceptions import (
+    InsufficientStockError,
+    ProductNotFoundError,
+    StockNotFoundError
+)
+
+# Com PROMETHEUS_MULTIPROC_DIR definido (antes de iniciar os workers), cada
+# processo grava as métricas em arquivos desse diretório e o /metrics de
+# qualquer worker soma todos.
+
+STOCK_OPERATION_SECONDS = Histogram(
+    'stock_operation_duration_seconds',
+    'Duração das operações do StockService',
+    ['operation'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+STOCK_LOCK_WAIT_SECONDS = Histogram(
+    'stock_lock_wait_seconds',
+    'Tempo das instruções com select_for_update (FOR UPDATE) numa operação, incluindo a espera pela trava',
+    ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+STOCK_ERRORS = Counter(
+    'stock_errors_total',
+    'Erros de estoque por tipo',
+    ['error']
+)
+# Só o estoque insuficiente vai por produto: o id existe (tem linha de
+# estoque). Nos erros de produto ou estoque inexistente o id vem do cliente, e
+# ids inventados criariam séries sem limite.
+STOCK_INSUFFICIENT = Counter(
+    'stock_insufficient_total',
+    'Pedidos recusados por estoque insuficiente, por produto',
+    ['product_id']
+)
+
+TRACKED_ERRORS = (InsufficientStockError, StockNotFoundError, ProductNotFoundError)
+
+
+def record_stock_error(exc: Exception) -> None:
+    """Conta o erro pelo tipo (e por produto, no estoque insuficiente), se for um dos acompanhados"""
+    if not isinstance(exc, TRACKED_ERRORS):
+        return
+    STOCK_ERRORS.labels(type(exc).__name__).inc()
+    if isinstance(exc, InsufficientStockError):
+        STOCK_INSUFFICIENT.labels(str(exc.product_id)).inc()
+
+
+def observed(operation: str):
+    """Mede duração, espera por travas e erros de estoque da operação"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            lock_wait = 0.0
+
+            def measure_locks(execute, sql, params, many, context):
+                nonlocal lock_wait
+                if 'FOR UPDATE' not in sql:
+                    return execute(sql, params, many, context)
+                started = time.perf_counter()
+                try:
+                    return execute(sql, params, many, context)
+                finally:
+                    lock_wait += time.perf_counter() - started
+
+            started = time.perf_counter()
+            try:
+                with connection.execute_wrapper(measure_locks):
+                    return function(*args, **kwargs)
+            except Exception as exc:
+                record_stock_error(exc)
+                raise
+            finally:
+                STOCK_OPERATION_SECONDS.labels(operation).observe(time.perf_counter() - started)
+                if lock_wait:
+                    STOCK_LOCK_WAIT_SECONDS.labels(operation).observe(lock_wait)
+        return wrapper
+    return decorator
+
+
+class TodayStockCollector:
+    """Saldo livre de hoje por produto, lido do banco a cada coleta"""
+
+    def describe(self):
+        # Sem describe o registro chamaria collect (e o banco) ao registrar
+        yield self._gauge()
+
+    def collect(self):
+        from .models import AvailableProduct
+
+        gauge = self._gauge()
+        rows = AvailableProduct.objects.filter(
+            date=timezone.now().date()
+        ).order_by('product_id').available_values_list('product_id')
+        for product_id, available_in_ml in rows:
+            gauge.add_metric([str(product_id)], available_in_ml)
+        yield gauge
+
+    def _gauge(self):
+        return GaugeMetricFamily(
+            'stock_available_ml',
+            'Saldo livre de hoje por produto, em ml',
+            labels=['product_id']
+        )
+
+
+def metrics_registry() -> CollectorRegistry:
+    """Registro a expor: o do processo ou, em modo multiprocesso, a soma dos workers"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(TodayStockCollector())
+        return registry
+    return REGISTRY
+
+
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    REGISTRY.register(TodayStockCollector())
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_product_prices(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductPrice = apps.get_model('products', 'ProductPrice')
+    ProductPrice.objects.bulk_create(
+        [
+            ProductPrice(
+                product_id=product_id,
+                size_ml=price['size_ml'],
+                price_in_cents=price['price_in_cents']
+            )
+            for product_id, prices in Product.objects.values_list('id', 'prices').iterator()
+            for price in prices
+        ],
+        batch_size=1000
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size_ml', models.IntegerField()),
+                ('price_in_cents', models.IntegerField()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_prices_gin_idx',
+        ),
+        migrations.AddField(
+            model_name='productprice',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_entries', to='products.product'),
+        ),
+        migrations.AddIndex(
+            model_name='productprice',
+            index=models.Index(fields=['size_ml', 'price_in_cents'], include=('product',), name='productprice_size_price_idx'),
+        ),
+        migrations.RunPython(backfill_product_prices, migrations.RunPython.noop),
+    ]
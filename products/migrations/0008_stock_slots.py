@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_slots',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='stockreservationitem',
+            name='from_slots',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='AvailableProductSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('quantity_in_ml', models.IntegerField()),
+                ('available_product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='products.availableproduct')),
+            ],
+            options={
+                'unique_together': {('available_product', 'slot')},
+            },
+        ),
+    ]
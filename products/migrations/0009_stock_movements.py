@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:39
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_stock_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockreservation',
+            name='order_reference',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('consume', 'Consume'), ('restock', 'Restock'), ('adjustment', 'Adjustment')], max_length=10)),
+                ('quantity_in_ml', models.IntegerField()),
+                ('date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order_reference', models.CharField(blank=True, max_length=64, null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'created_at'], name='stockmovement_product_time_idx'), django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='stockmovement_created_brin')],
+            },
+        ),
+    ]
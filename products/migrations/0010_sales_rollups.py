@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_stock_movements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sold_in_ml', models.BigIntegerField()),
+                ('consumptions', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'day'], name='dailysales_product_day_idx')],
+                'unique_together': {('day', 'product')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('sold_in_ml', models.BigIntegerField()),
+                ('consumptions', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_sales', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'hour'], name='hourlysales_product_hour_idx')],
+                'unique_together': {('hour', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailableProductArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('quantity_in_ml', models.IntegerField()),
+                ('reserved_in_ml', models.IntegerField()),
+                ('slots_in_ml', models.IntegerField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='availableproduct',
+            index=models.Index(condition=models.Q(('quantity_in_ml__gt', 0)), fields=['date', 'product'], include=('id', 'quantity_in_ml', 'reserved_in_ml'), name='availableproduct_in_stock_idx'),
+        ),
+        migrations.AddField(
+            model_name='availableproductarchive',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_availability', to='products.product'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='availableproductarchive',
+            unique_together={('product', 'date')},
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.functions import Coalesce, Upper
+from django.contrib.postgres.indexes import BrinIndex, OpClass
 
 # Create your models here.
 
@@ -6,17 +8,253 @@ class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
     prices = models.JSONField(default=list)
+    # Com mais de um slot, o estoque do dia é dividido em AvailableProductSlot
+    # para que consumos simultâneos não disputem a mesma linha
+    stock_slots = models.PositiveSmallIntegerField(default=1)
+    
+    class Meta:
+        indexes = [
+            # Busca por prefixo do nome sem diferenciar maiúsculas (name__istartswith)
+            models.Index(OpClass(Upper('name'), name='text_pattern_ops'), name='product_name_prefix_idx'),
+        ]
     
     def __str__(self):
         return self.name
 
+class ProductPrice(models.Model):
+    """Cópia normalizada de Product.prices, mantida pelo CatalogService para consultas por tamanho e preço"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_entries')
+    size_ml = models.IntegerField()
+    price_in_cents = models.IntegerField()
+    
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['size_ml', 'price_in_cents'],
+                include=['product'],
+                name='productprice_size_price_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} - {self.size_ml}ml: {self.price_in_cents}"
+
+class AvailableProductQuerySet(models.QuerySet):
+    def with_slot_totals(self):
+        """Anota slots_in_ml com a soma dos slots (None para produtos sem sharding)"""
+        totals = AvailableProductSlot.objects.filter(
+            available_product=models.OuterRef('pk')
+        ).values('available_product').annotate(
+            total=models.Sum('quantity_in_ml')
+        ).values('total')
+        return self.annotate(slots_in_ml=models.Subquery(totals))
+    
+    def available_values_list(self, *fields):
+        """values_list de fields seguido do saldo livre, pela regra de available_in_ml"""
+        queryset = self if 'slots_in_ml' in self.query.annotations else self.with_slot_totals()
+        return queryset.values_list(
+            *fields,
+            Coalesce('slots_in_ml', models.F('quantity_in_ml') - models.F('reserved_in_ml'))
+        )
+    
+    def in_stock(self):
+        """Linhas com quantidade livre, somando os slots quando houver sharding"""
+        # quantity_in_ml > 0 vale para toda linha com saldo livre e casa com a
+        # condição do índice parcial availableproduct_in_stock_idx
+        return self.with_slot_totals().filter(
+            models.Q(slots_in_ml__isnull=True, quantity_in_ml__gt=models.F('reserved_in_ml'))
+            | models.Q(slots_in_ml__gt=0),
+            quantity_in_ml__gt=0
+        )
+
 class AvailableProduct(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='availability')
     quantity_in_ml = models.IntegerField()
+    # Parte de quantity_in_ml presa em reservas ativas (StockReservation)
+    reserved_in_ml = models.IntegerField(default=0)
     date = models.DateField(auto_now=True)
     
     class Meta:
         unique_together = ['product', 'date']
+        indexes = [
+            # Disponibilidade do dia (date=hoje, em estoque) só pelo índice,
+            # já na ordem de product_id e sem os dias zerados
+            models.Index(
+                fields=['date', 'product'],
+                include=['id', 'quantity_in_ml', 'reserved_in_ml'],
+                condition=models.Q(quantity_in_ml__gt=0),
+                name='availableproduct_in_stock_idx'
+            ),
+        ]
+    
+    objects = AvailableProductQuerySet.as_manager()
+    
+    @property
+    def available_in_ml(self):
+        # Com sharding o saldo livre está nos slots; as reservas já saíram deles
+        slots_in_ml = getattr(self, 'slots_in_ml', None)
+        if slots_in_ml is not None:
+            return slots_in_ml
+        return self.quantity_in_ml - self.reserved_in_ml
     
     def __str__(self):
         return f"{self.product.name} - {self.quantity_in_ml}ml"
+
+class AvailableProductArchive(models.Model):
+    """Dias antigos de AvailableProduct, movidos pelo archive_availability"""
+    # Mesmo id da linha original
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_availability')
+    date = models.DateField()
+    quantity_in_ml = models.IntegerField()
+    reserved_in_ml = models.IntegerField()
+    # Soma dos slots no momento do arquivamento (None sem sharding)
+    slots_in_ml = models.IntegerField(null=True)
+    
+    class Meta:
+        unique_together = ['product', 'date']
+    
+    def __str__(self):
+        return f"{self.product_id} {self.date} - {self.quantity_in_ml}ml"
+
+class AvailableProductSlot(models.Model):
+    """Fatia do estoque do dia de um produto com sharding (Product.stock_slots > 1)"""
+    available_product = models.ForeignKey(AvailableProduct, on_delete=models.CASCADE, related_name='slots')
+    slot = models.PositiveSmallIntegerField()
+    quantity_in_ml = models.IntegerField()
+    
+    class Meta:
+        unique_together = ['available_product', 'slot']
+    
+    def __str__(self):
+        return f"{self.available_product_id}#{self.slot} - {self.quantity_in_ml}ml"
+
+class StockReservation(models.Model):
+    """Reserva temporária de estoque, confirmada como consumo ou devolvida"""
+    ACTIVE = 'active'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (ACTIVE, 'Active'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+        (EXPIRED, 'Expired'),
+    ]
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    # Levado para as StockMovement geradas na confirmação
+    order_reference = models.CharField(max_length=64, null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Varredura de expiração só olha reservas ativas
+            models.Index(
+                fields=['expires_at'],
+                condition=models.Q(status='active'),
+                name='reservation_active_expiry_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Reserva {self.pk} ({self.status})"
+
+class StockReservationItem(models.Model):
+    reservation = models.ForeignKey(StockReservation, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservation_items')
+    date = models.DateField()
+    quantity_in_ml = models.IntegerField()
+    # True quando a quantidade saiu dos slots em vez de ir para reserved_in_ml
+    from_slots = models.BooleanField(default=False)
+    
+    def __str__(self):
+        return f"{self.product_id} - {self.quantity_in_ml}ml"
+
+class StockMovement(models.Model):
+    """Lançamento do livro de estoque: só é inserido, nunca alterado"""
+    CONSUME = 'consume'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (CONSUME, 'Consume'),
+        (RESTOCK, 'Restock'),
+        (ADJUSTMENT, 'Adjustment'),
+    ]
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Negativo para saídas, positivo para entradas
+    quantity_in_ml = models.IntegerField()
+    # Dia de estoque (AvailableProduct.date) afetado
+    date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    order_reference = models.CharField(max_length=64, null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Movimentos de um produto num intervalo de tempo
+            models.Index(fields=['product', 'created_at'], name='stockmovement_product_time_idx'),
+            # Intervalos de tempo de todos os produtos; a tabela só cresce em
+            # ordem de created_at, então um BRIN ocupa quase nada
+            BrinIndex(fields=['created_at'], name='stockmovement_created_brin'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} {self.kind} {self.quantity_in_ml}ml"
+
+class IdempotencyKey(models.Model):
+    """Resposta da primeira execução de uma escrita com Idempotency-Key, devolvida nas repetições"""
+    key = models.CharField(max_length=255, unique=True)
+    # sha256 do método, rota e corpo da requisição original
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.key} ({self.status_code})"
+
+class HourlySales(models.Model):
+    """Consumo de um produto numa hora, recalculado do livro de estoque pelo rollup_sales"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='hourly_sales')
+    hour = models.DateTimeField()
+    sold_in_ml = models.BigIntegerField()
+    # Lançamentos de consumo somados (um por pedido que levou o produto)
+    consumptions = models.PositiveIntegerField()
+    
+    class Meta:
+        # O único atende intervalos de todos os produtos; o índice, de um produto
+        unique_together = ['hour', 'product']
+        indexes = [
+            models.Index(fields=['product', 'hour'], name='hourlysales_product_hour_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} {self.hour:%Y-%m-%d %H}h - {self.sold_in_ml}ml"
+
+class DailySales(models.Model):
+    """Consumo de um produto num dia, somado a partir de HourlySales"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    sold_in_ml = models.BigIntegerField()
+    consumptions = models.PositiveIntegerField()
+    
+    class Meta:
+        unique_together = ['day', 'product']
+        indexes = [
+            models.Index(fields=['product', 'day'], name='dailysales_product_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} {self.day} - {self.sold_in_ml}ml"
+
+class CatalogVersion(models.Model):
+    """Linha única com a versão do catálogo, incrementada a cada escrita em Product"""
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"v{self.version}"
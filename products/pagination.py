@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """Paginação por cursor em id: cada página é um WHERE id > cursor, sem OFFSET"""
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
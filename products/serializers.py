@@ -1,10 +1,63 @@
+from datetime import timedelta
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Product, AvailableProduct
+from core.instrumentation import TimedSerializerMixin
+from .models import Product, AvailableProduct, StockReservation, StockReservationItem
+from .services.sales_report_service import MAX_HOURLY_DAYS
 
-class ProductSerializer(serializers.ModelSerializer):
+# Maior valor das colunas integer (int4) de quantidade e preço
+MAX_INTEGER = 2 ** 31 - 1
+
+class ProductListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """Cria e atualiza produtos em lote com bulk_create/bulk_update"""
+    
+    def run_child_validation(self, data):
+        # Na atualização em lote cada item é validado contra o produto do seu id
+        if self.instance is not None:
+            product_id = data.get('id') if isinstance(data, dict) else None
+            if product_id is None:
+                raise serializers.ValidationError({'id': ["id is required"]})
+            if product_id not in self._products:
+                raise serializers.ValidationError({'id': [f"product with id {product_id} not found"]})
+            if product_id in self._seen_ids:
+                raise serializers.ValidationError({'id': [f"product {product_id} is repeated in the request"]})
+            self._seen_ids.add(product_id)
+            self.child.instance = self._products[product_id]
+            self.child.initial_data = data
+        return super().run_child_validation(data)
+    
+    def to_internal_value(self, data):
+        self._products = {product.pk: product for product in self.instance or []}
+        self._seen_ids = set()
+        return super().to_internal_value(data)
+    
+    def create(self, validated_data):
+        return Product.objects.bulk_create([Product(**attrs) for attrs in validated_data])
+    
+    def update(self, instances, validated_data):
+        products = {product.pk: product for product in instances}
+        changed_products = []
+        changed_fields = set()
+        
+        for item, attrs in zip(self.initial_data, validated_data):
+            product = products[item['id']]
+            fields = [field for field, value in attrs.items() if getattr(product, field) != value]
+            for field in fields:
+                setattr(product, field, attrs[field])
+            if fields:
+                changed_products.append(product)
+                changed_fields.update(fields)
+        
+        # Só os produtos e campos que realmente mudaram vão para o UPDATE
+        if changed_products:
+            Product.objects.bulk_update(changed_products, sorted(changed_fields))
+        return [products[item['id']] for item in self.initial_data]
+
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'prices']
+        list_serializer_class = ProductListSerializer
         
     def validate_prices(self, value):
         if not isinstance(value, list):
@@ -24,30 +77,94 @@ class ProductSerializer(serializers.ModelSerializer):
                 
         return value
 
-class ProductAvailabilityItemSerializer(serializers.Serializer):
+class ProductAvailabilityItemSerializer(TimedSerializerMixin, serializers.Serializer):
     product_id = serializers.IntegerField()
-    quantity_in_ml = serializers.IntegerField(min_value=0)
+    quantity_in_ml = serializers.IntegerField(min_value=0, max_value=MAX_INTEGER)
 
-class AvailableProductInputSerializer(serializers.Serializer):
+class AvailableProductInputSerializer(TimedSerializerMixin, serializers.Serializer):
     products = serializers.ListField(
         child=ProductAvailabilityItemSerializer()
     )
 
-class AvailableProductOutputItemSerializer(serializers.ModelSerializer):
-    product_id = serializers.IntegerField(source='product.id')
+class AvailableProductOutputItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    product_id = serializers.IntegerField(read_only=True)
+    # Quantidade livre, já descontadas as reservas ativas
+    quantity_in_ml = serializers.IntegerField(source='available_in_ml', read_only=True)
     
     class Meta:
         model = AvailableProduct
         fields = ['product_id', 'quantity_in_ml']
 
-class AvailableProductOutputSerializer(serializers.Serializer):
+class AvailableProductOutputSerializer(TimedSerializerMixin, serializers.Serializer):
     products = AvailableProductOutputItemSerializer(many=True)
 
-class ConsumeStockItemSerializer(serializers.Serializer):
+class ConsumeStockItemSerializer(TimedSerializerMixin, serializers.Serializer):
     product_id = serializers.IntegerField()
-    quantity_in_ml = serializers.IntegerField(min_value=1)
+    quantity_in_ml = serializers.IntegerField(min_value=1, max_value=MAX_INTEGER)
 
-class ConsumeStockInputSerializer(serializers.Serializer):
+class ConsumeStockInputSerializer(TimedSerializerMixin, serializers.Serializer):
     products = serializers.ListField(
         child=ConsumeStockItemSerializer()
-    ) 
\ No newline at end of file
+    )
+    # Gravada nos movimentos do livro de estoque (StockMovement)
+    order_reference = serializers.CharField(max_length=64, required=False)
+    
+    def validate_products(self, value):
+        # As quantidades do mesmo produto são somadas antes de ir para o banco
+        totals = {}
+        for item in value:
+            totals[item['product_id']] = totals.get(item['product_id'], 0) + item['quantity_in_ml']
+        too_large = [product_id for product_id, total in totals.items() if total > MAX_INTEGER]
+        if too_large:
+            raise serializers.ValidationError(
+                f"Total quantity_in_ml per product must be at most {MAX_INTEGER} (products {too_large})"
+            )
+        return value
+
+class ReserveStockInputSerializer(ConsumeStockInputSerializer):
+    ttl_seconds = serializers.IntegerField(min_value=1, required=False)
+
+class StockReservationItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    product_id = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = StockReservationItem
+        fields = ['product_id', 'quantity_in_ml']
+
+class StockReservationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    products = StockReservationItemSerializer(many=True, source='items')
+    
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'status', 'expires_at', 'order_reference', 'products']
+
+class SalesReportQuerySerializer(TimedSerializerMixin, serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=['hour', 'day'], default='hour')
+    # Padrão: os últimos 30 dias, incluindo hoje
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    product_id = serializers.ListField(child=serializers.IntegerField(), required=False)
+    
+    def validate(self, data):
+        data.setdefault('end', timezone.localdate())
+        data.setdefault('start', data['end'] - timedelta(days=29))
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({'start': ['start must not be after end']})
+        if data['granularity'] == 'hour' and (data['end'] - data['start']).days >= MAX_HOURLY_DAYS:
+            raise serializers.ValidationError({
+                'granularity': [f'hourly reports are limited to {MAX_HOURLY_DAYS} days; use granularity=day']
+            })
+        return data
+
+class SalesReportItemSerializer(TimedSerializerMixin, serializers.Serializer):
+    product_id = serializers.IntegerField()
+    # Início da hora (granularity=hour) ou o dia (granularity=day)
+    bucket = serializers.CharField()
+    sold_in_ml = serializers.IntegerField()
+    consumptions = serializers.IntegerField()
+
+class SalesReportSerializer(TimedSerializerMixin, serializers.Serializer):
+    granularity = serializers.CharField()
+    start = serializers.DateField()
+    end = serializers.DateField()
+    results = SalesReportItemSerializer(many=True)
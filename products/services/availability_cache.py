@@ -0,0 +1,221 @@
+import threading
+import time
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from core.db_router import caught_up_replica, primary_wal_lsn, replica_reads
+
+
+class LocalMemoryBackend:
+    """Guarda o snapshot na memória do próprio worker.
+
+    A versão também é local, então uma escrita feita em outro processo só é
+    vista depois que o TIMEOUT expira. Com vários workers, prefira o backend
+    'django' apontando para um cache compartilhado.
+    """
+
+    def __init__(self, timeout: int):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries = {}
+        self._min_lsn = (0, None)
+
+    def get_version(self) -> int:
+        return self._version
+
+    def bump_version(self) -> int:
+        with self._lock:
+            self._version += 1
+            self._entries = {}
+            return self._version
+
+    def set_min_lsn(self, version: int, lsn: str) -> None:
+        self._min_lsn = (version, lsn)
+
+    def get_min_lsn(self, version: int) -> Optional[str]:
+        min_lsn_version, lsn = self._min_lsn
+        return lsn if min_lsn_version == version else None
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: str, payload: Dict) -> None:
+        # Só o snapshot mais recente interessa, então o anterior é descartado
+        with self._lock:
+            self._entries = {key: (time.monotonic() + self.timeout, payload)}
+
+    # Tudo fica em memória, então as versões assíncronas não esperam por nada
+    async def aget_version(self) -> int:
+        return self.get_version()
+
+    async def aget_min_lsn(self, version: int) -> Optional[str]:
+        return self.get_min_lsn(version)
+
+    async def aget(self, key: str) -> Optional[Dict]:
+        return self.get(key)
+
+    async def aset(self, key: str, payload: Dict) -> None:
+        self.set(key, payload)
+
+
+class DjangoCacheBackend:
+    """Guarda versão e snapshot num cache do Django compartilhado entre workers"""
+
+    VERSION_KEY = 'available-products:version'
+    # (versão, LSN) da última invalidação; se um escritor mais lento gravar
+    # por cima uma versão anterior, o snapshot da atual vai para o primário
+    MIN_LSN_KEY = 'available-products:min-lsn'
+
+    def __init__(self, alias: str, timeout: int):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get_version(self) -> int:
+        version = self.cache.get(self.VERSION_KEY)
+        if version is None:
+            self.cache.add(self.VERSION_KEY, 0, timeout=None)
+            version = self.cache.get(self.VERSION_KEY, 0)
+        return version
+
+    def bump_version(self) -> int:
+        self.cache.add(self.VERSION_KEY, 0, timeout=None)
+        return self.cache.incr(self.VERSION_KEY)
+
+    def set_min_lsn(self, version: int, lsn: str) -> None:
+        self.cache.set(self.MIN_LSN_KEY, (version, lsn), timeout=None)
+
+    def get_min_lsn(self, version: int) -> Optional[str]:
+        min_lsn_version, lsn = self.cache.get(self.MIN_LSN_KEY, (None, None))
+        return lsn if min_lsn_version == version else None
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.cache.get(key)
+
+    def set(self, key: str, payload: Dict) -> None:
+        self.cache.set(key, payload, timeout=self.timeout)
+
+    async def aget_version(self) -> int:
+        version = await self.cache.aget(self.VERSION_KEY)
+        if version is None:
+            await self.cache.aadd(self.VERSION_KEY, 0, timeout=None)
+            version = await self.cache.aget(self.VERSION_KEY, 0)
+        return version
+
+    async def aget_min_lsn(self, version: int) -> Optional[str]:
+        min_lsn_version, lsn = await self.cache.aget(self.MIN_LSN_KEY, (None, None))
+        return lsn if min_lsn_version == version else None
+
+    async def aget(self, key: str) -> Optional[Dict]:
+        return await self.cache.aget(key)
+
+    async def aset(self, key: str, payload: Dict) -> None:
+        await self.cache.aset(key, payload, timeout=self.timeout)
+
+
+class AvailabilityCache:
+    """
+    Cache versionado do payload de produtos disponíveis do dia.
+
+    Com réplicas, cada invalidação guarda junto da versão o LSN do primário
+    depois do commit. O snapshot da versão só é montado numa réplica que já
+    aplicou o WAL até ali; sem uma assim (ou sem LSN conhecido), é montado no
+    primário, para que o cache nunca guarde um estado anterior à escrita.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, build: Callable[[], Dict]) -> Dict:
+        # A versão é lida antes da consulta: se uma escrita terminar no meio,
+        # o snapshot fica guardado numa versão que já foi invalidada.
+        version = self.backend.get_version()
+        key = self._key(version)
+
+        payload = self.backend.get(key)
+        self._count(payload is not None)
+        if payload is None:
+            with self._reads_from(self._replica_for(version)):
+                payload = build()
+            self.backend.set(key, payload)
+        return payload
+
+    async def aget_or_build(self, build: Callable[[], Awaitable[Dict]]) -> Dict:
+        """Versão assíncrona de get_or_build; build é uma corrotina"""
+        version = await self.backend.aget_version()
+        key = self._key(version)
+
+        payload = await self.backend.aget(key)
+        self._count(payload is not None)
+        if payload is None:
+            with self._reads_from(await self._areplica_for(version)):
+                payload = await build()
+            await self.backend.aset(key, payload)
+        return payload
+
+    def _replica_for(self, version: int) -> Optional[str]:
+        if not settings.DB_REPLICAS:
+            return None
+        lsn = self.backend.get_min_lsn(version)
+        return caught_up_replica(lsn) if lsn else None
+
+    async def _areplica_for(self, version: int) -> Optional[str]:
+        if not settings.DB_REPLICAS:
+            return None
+        lsn = await self.backend.aget_min_lsn(version)
+        return await sync_to_async(caught_up_replica)(lsn) if lsn else None
+
+    @staticmethod
+    def _reads_from(replica: Optional[str]):
+        return replica_reads(using=replica) if replica else nullcontext()
+
+    def _key(self, version: int) -> str:
+        today = timezone.now().date()
+        return f'available-products:{today.isoformat()}:{version}'
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self) -> None:
+        version = self.backend.bump_version()
+        if settings.DB_REPLICAS:
+            # Chamado no on_commit e lido depois da nova versão, o LSN cobre
+            # esta escrita e as de todas as versões anteriores. Até ele ser
+            # gravado, o snapshot da versão é montado no primário.
+            self.backend.set_min_lsn(version, primary_wal_lsn())
+
+    def stats(self) -> Dict:
+        return {
+            'backend': type(self.backend).__name__,
+            'version': self.backend.get_version(),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_availability_cache() -> AvailabilityCache:
+    """Instancia o cache configurado em settings.AVAILABLE_PRODUCTS_CACHE"""
+    config = getattr(settings, 'AVAILABLE_PRODUCTS_CACHE', {})
+    timeout = config.get('TIMEOUT', 5)
+
+    if config.get('BACKEND', 'local') == 'django':
+        backend = DjangoCacheBackend(config.get('ALIAS', 'default'), timeout)
+    else:
+        backend = LocalMemoryBackend(timeout)
+
+    return AvailabilityCache(backend)
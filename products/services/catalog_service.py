@@ -0,0 +1,64 @@
+from typing import List, Optional, Tuple
+from datetime import datetime
+from django.db.models import F
+from django.utils import timezone
+from ..models import CatalogVersion, Product, ProductPrice
+
+CATALOG_VERSION_ID = 1
+
+
+class CatalogService:
+    @staticmethod
+    def get_version() -> Tuple[int, Optional[datetime]]:
+        """Retorna a versão atual do catálogo e quando ela mudou"""
+        current = CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).values_list(
+            'version', 'updated_at'
+        ).first()
+        if current is None:
+            catalog_version, _ = CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_ID)
+            current = (catalog_version.version, catalog_version.updated_at)
+        return current
+
+    @staticmethod
+    async def aget_version() -> Tuple[int, Optional[datetime]]:
+        """Versão assíncrona de get_version"""
+        current = await CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).values_list(
+            'version', 'updated_at'
+        ).afirst()
+        if current is None:
+            catalog_version, _ = await CatalogVersion.objects.aget_or_create(pk=CATALOG_VERSION_ID)
+            current = (catalog_version.version, catalog_version.updated_at)
+        return current
+
+    @staticmethod
+    def bump_version() -> None:
+        """Incrementa a versão do catálogo após criar, alterar ou remover produtos"""
+        updated = CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).update(
+            version=F('version') + 1,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_ID, defaults={'version': 1})
+
+    @staticmethod
+    def sync_prices(products: List[Product]) -> None:
+        """Regrava as linhas de ProductPrice a partir de Product.prices"""
+        ProductPrice.objects.filter(product__in=products).delete()
+        ProductPrice.objects.bulk_create([
+            ProductPrice(
+                product=product,
+                size_ml=price['size_ml'],
+                price_in_cents=price['price_in_cents']
+            )
+            for product in products
+            for price in product.prices
+        ])
+
+    @staticmethod
+    def cheapest_by_size() -> List[dict]:
+        """Retorna, para cada tamanho, o produto com o menor preço"""
+        return list(
+            ProductPrice.objects.order_by('size_ml', 'price_in_cents', 'product_id')
+            .distinct('size_ml')
+            .values('size_ml', 'price_in_cents', 'product_id', product_name=F('product__name'))
+        )
@@ -0,0 +1,118 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import close_old_connections, connection
+from core.instrumentation import current_timings, timed, timings_for
+from ..models import AvailableProduct
+from .stock_service import StockService
+
+
+class ConsumeBatcher:
+    """
+    Junta os consumos que chegam a este processo em até max_wait_ms (ou
+    max_batch_size pedidos) e os aplica numa única transação, pelo
+    StockService.consume_stock_batch, numa thread própria. Cada chamador
+    recebe o próprio resultado ou a própria exceção.
+    """
+
+    def __init__(self, max_wait_ms: float = 5, max_batch_size: int = 50):
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.requests = 0
+        self.max_batch = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    @timed('stock')
+    def consume(self, products_data: List[Dict], order_reference: Optional[str] = None) -> List[AvailableProduct]:
+        """Mesmo contrato de StockService.consume_stock, aplicado em lote"""
+        # Dentro de uma transação do chamador o consumo precisa fazer parte dela
+        if connection.in_atomic_block:
+            return StockService.consume_stock(products_data, order_reference)
+
+        future = Future()
+        self._ensure_thread()
+        # As medições da requisição vão junto: a thread do batcher não tem o
+        # contexto dela
+        future.timings = current_timings()
+        self._queue.put((time.monotonic(), products_data, order_reference, future))
+        return future.result()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='consume-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][0] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.monotonic()
+        try:
+            # Cada requisição esperou pelo lote inteiro, então recebe as
+            # consultas e travas dele
+            with timings_for([future.timings for _, _, _, future in batch]):
+                results = StockService.consume_stock_batch([
+                    (products_data, order_reference) for _, products_data, order_reference, _ in batch
+                ])
+        except Exception as exc:
+            results = [exc] * len(batch)
+        finally:
+            # A conexão desta thread segue as mesmas regras de idade e saúde
+            # das conexões das requisições
+            close_old_connections()
+
+        self._record(len(batch), [started - queued_at for queued_at, _, _, _ in batch])
+        for (_, _, _, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _record(self, size: int, waits: List[float]):
+        with self._lock:
+            self.batches += 1
+            self.requests += size
+            self.max_batch = max(self.max_batch, size)
+            self.total_wait += sum(waits)
+            self.max_wait_seen = max(self.max_wait_seen, *waits)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'avg_batch_size': self.requests / self.batches if self.batches else 0,
+                'max_batch_size': self.max_batch,
+                'avg_wait_ms': self.total_wait * 1000 / self.requests if self.requests else 0,
+                'max_wait_ms': self.max_wait_seen * 1000,
+            }
+
+
+@lru_cache(maxsize=None)
+def get_consume_batcher() -> Optional[ConsumeBatcher]:
+    """O batcher configurado em settings.STOCK_CONSUME_BATCHING, ou None se desligado"""
+    config = getattr(settings, 'STOCK_CONSUME_BATCHING', {})
+    if not config.get('ENABLED', False):
+        return None
+    return ConsumeBatcher(config.get('MAX_WAIT_MS', 5), config.get('MAX_BATCH_SIZE', 50))
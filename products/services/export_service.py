@@ -0,0 +1,82 @@
+import csv
+from datetime import date
+from typing import Iterable, Iterator, Optional, Sequence
+import orjson
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from ..models import AvailableProduct, AvailableProductArchive, Product
+
+# Linhas buscadas por ida ao cursor do servidor e linhas por bloco escrito
+CHUNK_SIZE = 2000
+BATCH_SIZE = 500
+
+
+class _Echo:
+    """Arquivo falso para o csv.writer: devolve a linha em vez de guardá-la"""
+
+    def write(self, value):
+        return value
+
+
+class ExportService:
+    FORMATS = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv; charset=utf-8',
+    }
+    PRODUCT_FIELDS = ('id', 'name', 'description', 'prices')
+    AVAILABILITY_FIELDS = ('product_id', 'date', 'quantity_in_ml', 'reserved_in_ml', 'available_in_ml')
+
+    @staticmethod
+    def product_rows(chunk_size: int = CHUNK_SIZE) -> Iterator[tuple]:
+        """Todo o catálogo, lido em blocos por um cursor do servidor"""
+        return Product.objects.order_by('id').values_list(
+            *ExportService.PRODUCT_FIELDS
+        ).iterator(chunk_size=chunk_size)
+
+    @staticmethod
+    def availability_rows(
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        chunk_size: int = CHUNK_SIZE
+    ) -> Iterator[tuple]:
+        """Histórico de disponibilidade (inclusive o arquivado) entre start e end, por product/date"""
+        queryset = AvailableProduct.objects.all()
+        archived = AvailableProductArchive.objects.all()
+        if start is not None:
+            queryset = queryset.filter(date__gte=start)
+            archived = archived.filter(date__gte=start)
+        if end is not None:
+            queryset = queryset.filter(date__lte=end)
+            archived = archived.filter(date__lte=end)
+        fields = ExportService.AVAILABILITY_FIELDS[:-1]
+        return queryset.available_values_list(*fields).union(
+            archived.values_list(*fields, Coalesce('slots_in_ml', F('quantity_in_ml') - F('reserved_in_ml'))),
+            all=True
+        ).order_by('product_id', 'date').iterator(chunk_size=chunk_size)
+
+    @staticmethod
+    def render(
+        rows: Iterable[tuple],
+        fields: Sequence[str],
+        export_format: str,
+        batch_size: int = BATCH_SIZE
+    ) -> Iterator[bytes]:
+        """Converte as linhas em blocos de NDJSON ou CSV sem acumular a exportação"""
+        if export_format == 'csv':
+            writer = csv.writer(_Echo())
+            encode = lambda row: writer.writerow([
+                orjson.dumps(value).decode() if isinstance(value, (list, dict)) else value
+                for value in row
+            ])
+            yield writer.writerow(fields).encode()
+        else:
+            encode = lambda row: orjson.dumps(dict(zip(fields, row))).decode() + '\n'
+
+        batch = []
+        for row in rows:
+            batch.append(encode(row))
+            if len(batch) >= batch_size:
+                yield ''.join(batch).encode()
+                batch = []
+        if batch:
+            yield ''.join(batch).encode()
@@ -0,0 +1,86 @@
+import hashlib
+from datetime import timedelta
+from typing import Callable, Optional
+from django.conf import settings
+from django.db import transaction, connection
+from django.utils import timezone
+from rest_framework.response import Response
+from ..models import IdempotencyKey
+from ..exceptions.stock_exceptions import IdempotencyKeyReusedError
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyService:
+    @staticmethod
+    def fingerprint(request) -> str:
+        """Identifica a requisição pelo método, rota e corpo"""
+        digest = hashlib.sha256()
+        for part in (request.method.encode(), request.path.encode(), request.body):
+            digest.update(part)
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    @staticmethod
+    def stored_response(key: str, fingerprint: str) -> Optional[Response]:
+        """A resposta guardada para a chave, se ainda não venceu"""
+        record = IdempotencyKey.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+        if record is None:
+            return None
+        if record.fingerprint != fingerprint:
+            raise IdempotencyKeyReusedError(key)
+        return Response(record.response_body, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+
+    @staticmethod
+    def execute(
+        key: str,
+        fingerprint: str,
+        run: Callable[[], Response],
+        handle_exception: Callable[[Exception], Response]
+    ) -> Response:
+        """
+        Executa run uma única vez por chave e guarda a resposta (sucesso ou erro)
+        por IDEMPOTENCY_KEY_TTL_SECONDS. Repetições recebem a resposta guardada
+        sem abrir a transação de run; repetições simultâneas esperam a primeira.
+        """
+        replay = IdempotencyService.stored_response(key, fingerprint)
+        if replay is not None:
+            return replay
+
+        with transaction.atomic():
+            # Serializa as execuções da mesma chave até o commit da primeira
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))', [key])
+            replay = IdempotencyService.stored_response(key, fingerprint)
+            if replay is not None:
+                return replay
+
+            try:
+                with transaction.atomic():
+                    response = run()
+            except Exception as exc:
+                response = handle_exception(exc)
+
+            # Erros do servidor podem ser passageiros: a repetição executa de novo
+            if response.status_code < 500:
+                IdempotencyKey.objects.update_or_create(
+                    key=key,
+                    defaults={
+                        'fingerprint': fingerprint,
+                        'status_code': response.status_code,
+                        'response_body': response.data,
+                        'expires_at': timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+                    }
+                )
+            return response
+
+    @staticmethod
+    def purge_expired(batch_size: int = 1000) -> int:
+        """Apaga um lote de chaves vencidas"""
+        expired_ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('id', flat=True)[:batch_size]
+        )
+        if not expired_ids:
+            return 0
+        IdempotencyKey.objects.filter(id__in=expired_ids).delete()
+        return len(expired_ids)
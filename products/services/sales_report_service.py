@@ -0,0 +1,94 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+from django.db import transaction, connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+from ..models import DailySales, HourlySales, StockMovement
+
+# Chave do pg_advisory_xact_lock que impede dois rollups simultâneos
+ROLLUP_LOCK_KEY = 0x53414c4553
+# Limite de dias num relatório por hora; períodos maiores usam o diário
+MAX_HOURLY_DAYS = 93
+
+
+def day_start(day: date) -> datetime:
+    """Meia-noite do dia no fuso atual"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class SalesReportService:
+    @staticmethod
+    @transaction.atomic
+    def rollup(since: datetime, until: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Recalcula HourlySales nas horas entre since e until a partir do livro de
+        estoque, e DailySales nos dias que essas horas tocam. Recalcular (em vez
+        de somar) torna a operação idempotente e pega consumos gravados com
+        atraso dentro da janela.
+        """
+        until = until or timezone.now()
+        since = timezone.localtime(since).replace(minute=0, second=0, microsecond=0)
+        # A hora corrente entra parcial e é completada na próxima execução
+        until = timezone.localtime(until).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [ROLLUP_LOCK_KEY])
+
+        hourly = StockMovement.objects.filter(
+            kind=StockMovement.CONSUME,
+            created_at__gte=since,
+            created_at__lt=until
+        ).annotate(hour=TruncHour('created_at')).values('product_id', 'hour').annotate(
+            sold=Sum('quantity_in_ml'),
+            count=Count('id')
+        ).order_by()
+        HourlySales.objects.filter(hour__gte=since, hour__lt=until).delete()
+        hours = HourlySales.objects.bulk_create([
+            HourlySales(product_id=row['product_id'], hour=row['hour'], sold_in_ml=-row['sold'], consumptions=row['count'])
+            for row in hourly
+        ])
+
+        first_day = since.date()
+        last_day = (until - timedelta(microseconds=1)).date()
+        daily = HourlySales.objects.filter(
+            hour__gte=day_start(first_day),
+            hour__lt=day_start(last_day + timedelta(days=1))
+        ).annotate(day=TruncDate('hour')).values('product_id', 'day').annotate(
+            sold=Sum('sold_in_ml'),
+            count=Sum('consumptions')
+        ).order_by()
+        DailySales.objects.filter(day__gte=first_day, day__lte=last_day).delete()
+        days = DailySales.objects.bulk_create([
+            DailySales(product_id=row['product_id'], day=row['day'], sold_in_ml=row['sold'], consumptions=row['count'])
+            for row in daily
+        ])
+
+        return {'hours': len(hours), 'days': len(days)}
+
+    @staticmethod
+    def sales(
+        granularity: str,
+        start: date,
+        end: date,
+        product_ids: Optional[List[int]] = None
+    ) -> List[Dict]:
+        """Vendas por produto e hora (ou dia) entre start e end (inclusive), lidas só dos rollups"""
+        if granularity == 'hour':
+            queryset = HourlySales.objects.filter(
+                hour__gte=day_start(start),
+                hour__lt=day_start(end + timedelta(days=1))
+            ).order_by('hour', 'product_id')
+            bucket = 'hour'
+        else:
+            queryset = DailySales.objects.filter(day__gte=start, day__lte=end).order_by('day', 'product_id')
+            bucket = 'day'
+        if product_ids:
+            queryset = queryset.filter(product_id__in=product_ids)
+
+        return [
+            {'product_id': product_id, 'bucket': value, 'sold_in_ml': sold_in_ml, 'consumptions': consumptions}
+            for product_id, value, sold_in_ml, consumptions in queryset.values_list(
+                'product_id', bucket, 'sold_in_ml', 'consumptions'
+            )
+        ]
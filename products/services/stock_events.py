@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List
+import orjson
+import psycopg
+from psycopg import sql
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Pedido de snapshot: o assinante perdeu eventos e precisa recarregar tudo
+RESYNC = None
+
+# Eventos por NOTIFY; o payload do Postgres vai até 8000 bytes
+NOTIFY_CHUNK_SIZE = 100
+
+
+def encode_event(name: str, data) -> bytes:
+    """Um evento no formato text/event-stream"""
+    return b'event: ' + name.encode() + b'\ndata: ' + orjson.dumps(data) + b'\n\n'
+
+
+def encode_changes(events: List[Dict]) -> bytes:
+    """availability com o novo saldo livre, ou sold_out quando ele chega a zero"""
+    return b''.join(
+        encode_event('sold_out' if event['quantity_in_ml'] <= 0 else 'availability', event)
+        for event in events
+    )
+
+
+class Subscription:
+    """Fila de eventos de um cliente, consumida no event loop que a criou"""
+
+    def __init__(self, broadcaster: 'StockEventBroadcaster', queue_size: int):
+        self._broadcaster = broadcaster
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(queue_size)
+
+    def _deliver(self, item):
+        # Roda no loop do assinante. Um cliente lento demais perde o acumulado
+        # e recebe um snapshot no lugar, em vez de segurar memória sem limite.
+        if item is RESYNC or self._queue.full():
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            item = RESYNC
+        self._queue.put_nowait(item)
+
+    async def get(self, timeout: float):
+        """Próxima lista de eventos ou RESYNC; TimeoutError se nada chegar a tempo"""
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    def close(self):
+        self._broadcaster._unsubscribe(self)
+
+
+class StockEventBroadcaster:
+    """
+    Repassa as mudanças de estoque deste processo a todas as assinaturas
+    abertas. publish pode ser chamado de qualquer thread; cada assinatura
+    recebe os eventos no próprio event loop.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self, self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, events: List[Dict]):
+        self._send(events)
+
+    def resync(self):
+        self._send(RESYNC)
+
+    def _send(self, item):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription._loop.call_soon_threadsafe(subscription._deliver, item)
+            except RuntimeError:
+                # Loop já encerrado
+                self._unsubscribe(subscription)
+
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(self._subscriptions)
+
+
+class PostgresListener:
+    """
+    Thread com uma conexão própria em LISTEN no canal, que repassa cada
+    NOTIFY ao broadcaster deste processo. Reconecta sozinha; depois de cada
+    LISTEN pede um snapshot aos assinantes, já que eventos podem ter passado.
+    """
+
+    def __init__(self, broadcaster: StockEventBroadcaster, channel: str):
+        self.broadcaster = broadcaster
+        self.channel = channel
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stock-events-listener', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with psycopg.connect(**_listener_params(), autocommit=True) as listener:
+                    listener.execute(sql.SQL('LISTEN {}').format(sql.Identifier(self.channel)))
+                    self.broadcaster.resync()
+                    for notify in listener.notifies():
+                        self.broadcaster.publish(orjson.loads(notify.payload))
+            except psycopg.Error:
+                logger.exception("Conexão de LISTEN do canal %s caiu; reconectando", self.channel)
+                time.sleep(1)
+
+
+def _listener_params() -> Dict:
+    """Os parâmetros das conexões do app (OPTIONS incluídas, como sslmode), sem o pool"""
+    params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+    params.pop('pool', None)
+    return params
+
+
+@lru_cache(maxsize=None)
+def get_broadcaster() -> StockEventBroadcaster:
+    return StockEventBroadcaster(settings.STOCK_EVENTS['QUEUE_SIZE'])
+
+
+@lru_cache(maxsize=None)
+def _get_listener() -> PostgresListener:
+    return PostgresListener(get_broadcaster(), settings.STOCK_EVENTS['CHANNEL'])
+
+
+def subscribe() -> Subscription:
+    """Assina as mudanças de estoque (de todos os workers, com a ponte do Postgres)"""
+    if settings.STOCK_EVENTS['BRIDGE'] == 'postgres':
+        _get_listener().start()
+    return get_broadcaster().subscribe()
+
+
+def publish_on_commit(changes: Dict[int, int]) -> None:
+    """Publica {product_id: saldo livre} quando a transação atual for confirmada"""
+    if not changes:
+        return
+    events = [
+        {'product_id': product_id, 'quantity_in_ml': quantity_in_ml}
+        for product_id, quantity_in_ml in sorted(changes.items())
+    ]
+
+    config = settings.STOCK_EVENTS
+    if config['BRIDGE'] == 'postgres':
+        # NOTIFY é transacional: só sai no commit, na ordem dos commits, para
+        # os listeners de todos os workers (inclusive o deste processo)
+        with connection.cursor() as cursor:
+            for start in range(0, len(events), NOTIFY_CHUNK_SIZE):
+                cursor.execute(
+                    'SELECT pg_notify(%s, %s)',
+                    [config['CHANNEL'], orjson.dumps(events[start:start + NOTIFY_CHUNK_SIZE]).decode()]
+                )
+    else:
+        broadcaster = get_broadcaster()
+        transaction.on_commit(lambda: broadcaster.publish(events))
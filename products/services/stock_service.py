@@ -1,69 +1,874 @@
-from typing import List, Dict
+from datetime import date, timedelta
+from typing import List, Dict, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from ..models import Product, AvailableProduct
+from django.db import transaction, connection
+from django.db.models import Sum
+from core.db_router import pinned_to_primary
+from core.instrumentation import timed_class
+from ..metrics import observed, record_stock_error
+from ..models import (
+    Product,
+    AvailableProduct,
+    AvailableProductArchive,
+    AvailableProductSlot,
+    StockMovement,
+    StockReservation,
+    StockReservationItem
+)
+from ..serializers import AvailableProductOutputSerializer
+from .availability_cache import get_availability_cache
+from .stock_events import publish_on_commit
 from ..exceptions.stock_exceptions import (
+    AvailabilityBelowReservedError,
     InsufficientStockError,
-    ProductNotFoundError,
+    ProductsNotFoundError,
+    ReservationNotActiveError,
+    ReservationNotFoundError,
+    StockException,
     StockNotFoundError
 )
 
+# Trava as linhas do dia em ordem de product_id e aplica {assignment} em todas
+# numa única instrução, desde que cada produto tenha quantity_in_ml livre
+# (fora de reservas) suficiente. Se algum não tiver (ou não tiver registro),
+# nenhuma linha é alterada e o SELECT final devolve o motivo por produto.
+CONDITIONAL_STOCK_UPDATE_SQL = """
+WITH requested (product_id, quantity_in_ml) AS (
+    VALUES {values}
+),
+locked AS (
+    SELECT ap.id, ap.product_id, ap.quantity_in_ml - ap.reserved_in_ml AS available_in_ml
+    FROM {table} ap
+    JOIN requested r ON r.product_id = ap.product_id
+    WHERE ap.date = %s
+    ORDER BY ap.product_id
+    FOR UPDATE OF ap
+),
+shortfall AS (
+    SELECT 1
+    FROM requested r
+    LEFT JOIN locked l ON l.product_id = r.product_id
+    WHERE l.id IS NULL OR l.available_in_ml < r.quantity_in_ml
+),
+updated AS (
+    UPDATE {table} ap
+    SET {assignment}
+    FROM locked l
+    JOIN requested r ON r.product_id = l.product_id
+    WHERE ap.id = l.id
+      AND ap.quantity_in_ml - ap.reserved_in_ml >= r.quantity_in_ml
+      AND NOT EXISTS (SELECT 1 FROM shortfall)
+    RETURNING ap.id, ap.quantity_in_ml, ap.reserved_in_ml
+)
+SELECT r.product_id, l.id, l.available_in_ml, u.quantity_in_ml, u.reserved_in_ml
+FROM requested r
+LEFT JOIN locked l ON l.product_id = r.product_id
+LEFT JOIN updated u ON u.id = l.id
+"""
+
+CONSUME_ASSIGNMENT = "quantity_in_ml = ap.quantity_in_ml - r.quantity_in_ml"
+RESERVE_ASSIGNMENT = "reserved_in_ml = ap.reserved_in_ml + r.quantity_in_ml"
+
+# Efetiva ou devolve quantidades já reservadas. As linhas são travadas na
+# mesma ordem (product_id, date) usada pelo consumo.
+RESERVED_STOCK_UPDATE_SQL = """
+WITH held (product_id, date, quantity_in_ml) AS (
+    VALUES {values}
+),
+locked AS (
+    SELECT ap.id, h.quantity_in_ml
+    FROM {table} ap
+    JOIN held h ON h.product_id = ap.product_id AND h.date = ap.date
+    ORDER BY ap.product_id, ap.date
+    FOR UPDATE OF ap
+)
+UPDATE {table} ap
+SET {assignment}
+FROM locked l
+WHERE ap.id = l.id
+RETURNING ap.id, ap.product_id, ap.date, ap.quantity_in_ml, ap.reserved_in_ml
+"""
+
+COMMIT_RESERVED_ASSIGNMENT = (
+    "quantity_in_ml = ap.quantity_in_ml - l.quantity_in_ml, "
+    "reserved_in_ml = ap.reserved_in_ml - l.quantity_in_ml"
+)
+RELEASE_RESERVED_ASSIGNMENT = "reserved_in_ml = ap.reserved_in_ml - l.quantity_in_ml"
+
+# Produtos com sharding: tira a quantidade de um único slot com saldo
+# suficiente, escolhido ao acaso ({lock} com SKIP LOCKED restringe a escolha
+# aos que nenhuma outra transação travou), e devolve a linha do dia com a
+# soma dos slots já descontada. A escolha fica numa CTE para que a
+# rechecagem depois de esperar pelo slot não sorteie outro.
+TAKE_FROM_SLOT_SQL = """
+WITH picked AS (
+    SELECT s2.id
+    FROM {slot_table} s2
+    JOIN {stock_table} ap ON ap.id = s2.available_product_id
+    WHERE ap.product_id = %(product_id)s
+      AND ap.date = %(date)s
+      AND s2.quantity_in_ml >= %(quantity)s
+    ORDER BY random()
+    LIMIT 1
+    {lock}
+), taken AS (
+    UPDATE {slot_table} s
+    SET quantity_in_ml = s.quantity_in_ml - %(quantity)s
+    FROM picked
+    WHERE s.id = picked.id
+      AND s.quantity_in_ml >= %(quantity)s
+    RETURNING s.id, s.available_product_id, s.quantity_in_ml
+)
+SELECT ap.id, ap.quantity_in_ml, ap.reserved_in_ml, taken.quantity_in_ml + COALESCE((
+    SELECT SUM(s3.quantity_in_ml)
+    FROM {slot_table} s3
+    WHERE s3.available_product_id = ap.id
+      AND s3.id <> taken.id
+), 0)
+FROM taken
+JOIN {stock_table} ap ON ap.id = taken.available_product_id
+"""
+
+# Devolve uma quantidade ao slot com menor saldo do produto naquela data
+RETURN_TO_SLOT_SQL = """
+UPDATE {slot_table} s
+SET quantity_in_ml = s.quantity_in_ml + %(quantity)s
+WHERE s.id = (
+    SELECT s2.id
+    FROM {slot_table} s2
+    JOIN {stock_table} ap ON ap.id = s2.available_product_id
+    WHERE ap.product_id = %(product_id)s
+      AND ap.date = %(date)s
+    ORDER BY s2.quantity_in_ml, s2.slot
+    LIMIT 1
+    FOR UPDATE OF s2
+)
+"""
+
+# Move um lote de dias anteriores a %(before)s (com a soma dos seus slots) para
+# o arquivo numa única instrução; SKIP LOCKED deixa de fora linhas em uso.
+ARCHIVE_AVAILABILITY_SQL = """
+WITH batch AS (
+    SELECT ap.id
+    FROM {stock_table} ap
+    WHERE ap.date < %(before)s
+    ORDER BY ap.date, ap.id
+    LIMIT %(batch_size)s
+    FOR UPDATE SKIP LOCKED
+), removed_slots AS (
+    DELETE FROM {slot_table} s
+    USING batch
+    WHERE s.available_product_id = batch.id
+    RETURNING s.available_product_id, s.quantity_in_ml
+), moved AS (
+    DELETE FROM {stock_table} ap
+    USING batch
+    WHERE ap.id = batch.id
+    RETURNING ap.id, ap.product_id, ap.date, ap.quantity_in_ml, ap.reserved_in_ml
+)
+INSERT INTO {archive_table} (id, product_id, date, quantity_in_ml, reserved_in_ml, slots_in_ml)
+SELECT moved.id, moved.product_id, moved.date, moved.quantity_in_ml, moved.reserved_in_ml, (
+    SELECT SUM(removed_slots.quantity_in_ml)
+    FROM removed_slots
+    WHERE removed_slots.available_product_id = moved.id
+)
+FROM moved
+"""
+
+
+def split_evenly(total: int, parts: int) -> List[int]:
+    """Divide total em parts inteiros que diferem em no máximo 1"""
+    share, remainder = divmod(total, parts)
+    return [share + 1 if index < remainder else share for index in range(parts)]
+
+
+def _slot_sql(template: str, **extra) -> str:
+    return template.format(
+        slot_table=connection.ops.quote_name(AvailableProductSlot._meta.db_table),
+        stock_table=connection.ops.quote_name(AvailableProduct._meta.db_table),
+        **extra
+    )
+
+
+@timed_class('stock')
 class StockService:
     @staticmethod
     def get_available_products() -> List[AvailableProduct]:
         """Retorna todos os produtos disponíveis para hoje"""
         today = timezone.now().date()
-        return AvailableProduct.objects.filter(
-            date=today,
-            quantity_in_ml__gt=0
-        ).select_related('product')
+        return AvailableProduct.objects.filter(date=today).in_stock().select_related('product').order_by('product_id')
+
+    @staticmethod
+    def get_available_products_values() -> List[Dict]:
+        """Os itens de AvailableProductOutputSerializer direto de values_list, sem instanciar modelos"""
+        rows = StockService.get_available_products().available_values_list('product_id')
+        return [
+            {'product_id': product_id, 'quantity_in_ml': quantity_in_ml}
+            for product_id, quantity_in_ml in rows
+        ]
+
+    @staticmethod
+    @observed('get_available_products')
+    def get_available_products_payload(fast: bool = False) -> Dict:
+        """Retorna a resposta serializada dos produtos disponíveis hoje, via cache"""
+        if fast:
+            build = lambda: {"products": StockService.get_available_products_values()}
+        else:
+            build = lambda: AvailableProductOutputSerializer(
+                {"products": list(StockService.get_available_products())}
+            ).data
+        # Quem acabou de escrever lê do primário e ignora o snapshot. O
+        # snapshot só é montado numa réplica que já tenha aplicado a última
+        # escrita (AvailabilityCache).
+        if pinned_to_primary():
+            return build()
+        return get_availability_cache().get_or_build(build)
+
+    @staticmethod
+    async def aget_available_products() -> List[AvailableProduct]:
+        """Versão assíncrona de get_available_products, pelo ORM assíncrono"""
+        return [
+            available_product
+            async for available_product in StockService.get_available_products()
+        ]
+
+    @staticmethod
+    async def aget_available_products_payload() -> Dict:
+        """Versão assíncrona de get_available_products_payload"""
+        async def build():
+            return AvailableProductOutputSerializer(
+                {"products": await StockService.aget_available_products()}
+            ).data
+
+        if pinned_to_primary():
+            return await build()
+        return await get_availability_cache().aget_or_build(build)
 
     @staticmethod
+    @observed('update_availability')
+    @transaction.atomic
     def update_availability(products_data: List[Dict]) -> List[AvailableProduct]:
-        """Atualiza a disponibilidade dos produtos para hoje"""
+        """Atualiza a disponibilidade dos produtos para hoje num único upsert"""
+        # Se o mesmo produto vier mais de uma vez, vale a última quantidade
+        quantities = {}
+        for product_data in products_data:
+            quantities[product_data['product_id']] = product_data['quantity_in_ml']
+        if not quantities:
+            return []
+
+        stock_slots = dict(
+            Product.objects.filter(id__in=quantities).values_list('id', 'stock_slots')
+        )
+        missing_ids = [product_id for product_id in quantities if product_id not in stock_slots]
+        if missing_ids:
+            raise ProductsNotFoundError(missing_ids)
+
         today = timezone.now().date()
-        available_products = []
+        previous, reserved = StockService._lock_on_hand(quantities, today)
+        # O novo saldo precisa cobrir as reservas ativas, com ou sem sharding;
+        # abaixo disso o saldo livre ficaria negativo
+        for product_id in sorted(quantities):
+            if quantities[product_id] < reserved.get(product_id, 0):
+                raise AvailabilityBelowReservedError(product_id, quantities[product_id], reserved[product_id])
+        # Upsert em ordem de product_id, a mesma ordem de trava do consumo
+        available_products = AvailableProduct.objects.bulk_create(
+            [
+                AvailableProduct(product_id=product_id, quantity_in_ml=quantities[product_id], date=today)
+                for product_id in sorted(quantities)
+            ],
+            update_conflicts=True,
+            unique_fields=['product', 'date'],
+            update_fields=['quantity_in_ml']
+        )
+        StockService._reset_slots(available_products, stock_slots, today)
 
-        for product_data in products_data:
-            try:
-                product = Product.objects.get(id=product_data['product_id'])
-            except Product.DoesNotExist:
-                raise ProductNotFoundError(product_data['product_id'])
+        # A diferença para o saldo anterior vira entrada (restock) ou ajuste
+        movements = []
+        for product_id in sorted(quantities):
+            delta = quantities[product_id] - previous.get(product_id, 0)
+            kind = StockMovement.RESTOCK if delta > 0 else StockMovement.ADJUSTMENT
+            movements.append((product_id, today, kind, delta))
+        StockService._record_movements(movements)
+
+        # Relidas porque o upsert não devolve reserved_in_ml
+        by_product = {
+            available_product.product_id: available_product
+            for available_product in AvailableProduct.objects.filter(
+                product_id__in=quantities,
+                date=today
+            ).with_slot_totals()
+        }
+        StockService._publish_changes(by_product.values(), today)
+        transaction.on_commit(get_availability_cache().invalidate)
+        return [by_product[product_id] for product_id in quantities]
+
+    @staticmethod
+    def _publish_changes(available_products, today: date) -> None:
+        """Publica no commit o saldo livre de hoje das linhas alteradas (a última de cada produto vale)"""
+        publish_on_commit({
+            available_product.product_id: available_product.available_in_ml
+            for available_product in available_products
+            if available_product.date == today
+        })
+
+    @staticmethod
+    def _reset_slots(available_products: List[AvailableProduct], stock_slots: Dict[int, int], today: date) -> None:
+        """Redistribui o estoque do dia nos slots dos produtos com sharding"""
+        AvailableProductSlot.objects.filter(available_product__in=available_products).delete()
+
+        sharded = [
+            available_product for available_product in available_products
+            if stock_slots[available_product.product_id] > 1
+        ]
+        if not sharded:
+            return
+
+        # Reservas ativas tiradas dos slots continuam fora do saldo redistribuído
+        held = StockService._active_slot_holds(
+            [available_product.product_id for available_product in sharded],
+            today
+        )
+
+        slots = []
+        for available_product in sharded:
+            free = max(available_product.quantity_in_ml - held.get(available_product.product_id, 0), 0)
+            shares = split_evenly(free, stock_slots[available_product.product_id])
+            slots.extend(
+                AvailableProductSlot(available_product=available_product, slot=slot, quantity_in_ml=share)
+                for slot, share in enumerate(shares)
+            )
+            available_product.slots_in_ml = free
+        AvailableProductSlot.objects.bulk_create(slots)
 
-            available_product, _ = AvailableProduct.objects.update_or_create(
-                product=product,
+    @staticmethod
+    def _active_slot_holds(product_ids: List[int], today: date) -> Dict[int, int]:
+        """Quanto de cada produto está em reservas ativas que saíram dos slots"""
+        return dict(
+            StockReservationItem.objects.filter(
+                from_slots=True,
                 date=today,
-                defaults={'quantity_in_ml': product_data['quantity_in_ml']}
+                product_id__in=product_ids,
+                reservation__status=StockReservation.ACTIVE
+            ).values('product_id').annotate(total=Sum('quantity_in_ml')).values_list('product_id', 'total')
+        )
+
+    @staticmethod
+    def _lock_today(product_ids, today: date) -> Tuple[List[Tuple[int, int, int, int]], Dict[int, int]]:
+        """Trava as linhas do dia em ordem de product_id e depois seus slots; devolve linhas e somas dos slots"""
+        rows = list(
+            AvailableProduct.objects.select_for_update().filter(
+                product_id__in=product_ids,
+                date=today
+            ).order_by('product_id').values_list('id', 'product_id', 'quantity_in_ml', 'reserved_in_ml')
+        )
+        slot_totals = {}
+        for stock_id, quantity in AvailableProductSlot.objects.select_for_update().filter(
+            available_product_id__in=[stock_id for stock_id, _, _, _ in rows]
+        ).order_by('available_product_id', 'slot').values_list('available_product_id', 'quantity_in_ml'):
+            slot_totals[stock_id] = slot_totals.get(stock_id, 0) + quantity
+        return rows, slot_totals
+
+    @staticmethod
+    def _lock_on_hand(product_ids, today: date) -> Tuple[Dict[int, int], Dict[int, int]]:
+        """
+        Trava as linhas do dia (e seus slots) e devolve o saldo físico e o
+        total em reservas ativas de cada produto.
+        """
+        # Saldo físico inclui o que está reservado: quantity_in_ml, ou, com
+        # sharding, a soma dos slots mais as reservas ativas tiradas deles
+        rows, slot_totals = StockService._lock_today(product_ids, today)
+        held = StockService._active_slot_holds([product_id for _, product_id, _, _ in rows], today)
+
+        on_hand, reserved = {}, {}
+        for stock_id, product_id, quantity, reserved_in_ml in rows:
+            if stock_id in slot_totals:
+                on_hand[product_id] = slot_totals[stock_id] + held.get(product_id, 0)
+            else:
+                on_hand[product_id] = quantity
+            reserved[product_id] = reserved_in_ml + held.get(product_id, 0)
+        return on_hand, reserved
+
+    @staticmethod
+    def _record_movements(movements, order_reference: Optional[str] = None) -> None:
+        """Grava os movimentos (product_id, date, kind, quantidade com sinal) num único INSERT"""
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                product_id=product_id,
+                date=movement_date,
+                kind=kind,
+                quantity_in_ml=quantity,
+                order_reference=order_reference
             )
-            available_products.append(available_product)
+            for product_id, movement_date, kind, quantity in movements
+            if quantity
+        ])
 
-        return available_products
+    @staticmethod
+    def _split_sharded(requested: Dict[int, int], today: date) -> Tuple[Dict[int, int], Dict[int, int]]:
+        """Separa os produtos cujo estoque de hoje está dividido em slots"""
+        if not requested:
+            return {}, {}
+
+        sharded_ids = set(
+            AvailableProduct.objects.filter(
+                product_id__in=requested,
+                date=today,
+                slots__isnull=False
+            ).values_list('product_id', flat=True)
+        )
+        regular = {product_id: quantity for product_id, quantity in requested.items() if product_id not in sharded_ids}
+        sharded = {product_id: quantity for product_id, quantity in requested.items() if product_id in sharded_ids}
+        return regular, sharded
 
     @staticmethod
-    @transaction.atomic
-    def consume_stock(products_data: List[Dict]) -> List[AvailableProduct]:
-        """Consome estoque dos produtos disponíveis"""
+    def _take_from_slots(sharded: Dict[int, int], today: date) -> Dict[int, AvailableProduct]:
+        """Tira cada quantidade de um slot com saldo; se nenhum tiver sozinho, junta e redistribui"""
+        updated_products = {}
+        for product_id in sorted(sharded):
+            quantity = sharded[product_id]
+            # Primeiro um slot livre; se todos estiverem travados, espera por
+            # um só. Só quando nenhum slot cobre a quantidade sozinho é que
+            # todos são travados e redistribuídos.
+            row = (
+                StockService._take_one_slot(product_id, quantity, today, 'FOR UPDATE OF s2 SKIP LOCKED')
+                or StockService._take_one_slot(product_id, quantity, today, '')
+            )
+            if row is not None:
+                stock_id, quantity_in_ml, reserved_in_ml, slots_in_ml = row
+            else:
+                slots = list(
+                    AvailableProductSlot.objects.select_for_update(of=('self',)).filter(
+                        available_product__product_id=product_id,
+                        available_product__date=today
+                    ).select_related('available_product').order_by('slot')
+                )
+                if not slots:
+                    raise StockNotFoundError(product_id)
+
+                total = sum(slot.quantity_in_ml for slot in slots)
+                if total < quantity:
+                    raise InsufficientStockError(product_id, total, quantity)
+
+                for slot, share in zip(slots, split_evenly(total - quantity, len(slots))):
+                    slot.quantity_in_ml = share
+                AvailableProductSlot.objects.bulk_update(slots, ['quantity_in_ml'])
+
+                stock = slots[0].available_product
+                stock_id, quantity_in_ml, reserved_in_ml = stock.id, stock.quantity_in_ml, stock.reserved_in_ml
+                slots_in_ml = total - quantity
+
+            available_product = AvailableProduct(
+                id=stock_id,
+                product_id=product_id,
+                quantity_in_ml=quantity_in_ml,
+                reserved_in_ml=reserved_in_ml,
+                date=today
+            )
+            available_product.slots_in_ml = slots_in_ml
+            updated_products[product_id] = available_product
+
+        return updated_products
+
+    @staticmethod
+    def _take_one_slot(product_id: int, quantity: int, today: date, lock: str) -> Optional[Tuple]:
+        """Tira a quantidade de um único slot, ou devolve None sem deixar travas"""
+        # Um slot que falha na rechecagem depois de esperar continua travado;
+        # voltar ao savepoint solta essas travas antes da próxima tentativa,
+        # que pode travar outros slots em outra ordem.
+        savepoint = transaction.savepoint()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _slot_sql(TAKE_FROM_SLOT_SQL, lock=lock),
+                {'quantity': quantity, 'product_id': product_id, 'date': today}
+            )
+            row = cursor.fetchone()
+        if row is None:
+            transaction.savepoint_rollback(savepoint)
+        return row
+
+    @staticmethod
+    def _return_to_slots(held: Dict[Tuple[int, date], int]) -> None:
+        """Devolve quantidades reservadas aos slots de onde saíram"""
+        for (product_id, held_date), quantity in sorted(held.items()):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    _slot_sql(RETURN_TO_SLOT_SQL),
+                    {'quantity': quantity, 'product_id': product_id, 'date': held_date}
+                )
+
+    @staticmethod
+    def _slot_totals(product_ids, today: date) -> Dict[int, AvailableProduct]:
+        """Linhas de hoje dos produtos com sharding, anotadas com a soma dos slots"""
+        if not product_ids:
+            return {}
+        return {
+            available_product.product_id: available_product
+            for available_product in AvailableProduct.objects.filter(
+                product_id__in=product_ids,
+                date=today
+            ).with_slot_totals()
+        }
+
+    @staticmethod
+    def _release_held(held_in_reserved: Dict[Tuple[int, date], int], held_in_slots: Dict[Tuple[int, date], int]) -> None:
+        """Devolve as quantidades reservadas ao saldo livre e publica os novos saldos de hoje"""
+        released = StockService._apply_reserved_update(held_in_reserved, RELEASE_RESERVED_ASSIGNMENT)
+        StockService._return_to_slots(held_in_slots)
+
         today = timezone.now().date()
-        updated_products = []
+        released.extend(StockService._slot_totals(
+            [product_id for product_id, held_date in held_in_slots if held_date == today],
+            today
+        ).values())
+        StockService._publish_changes(released, today)
 
+    @staticmethod
+    def _sum_by_product(products_data: List[Dict]) -> Dict[int, int]:
+        """Soma as quantidades por produto, preservando a ordem do pedido"""
+        requested = {}
         for product_data in products_data:
-            try:
-                available_product = AvailableProduct.objects.select_for_update().get(
-                    product_id=product_data['product_id'],
-                    date=today
-                )
-            except AvailableProduct.DoesNotExist:
-                raise StockNotFoundError(product_data['product_id'])
-
-            if available_product.quantity_in_ml < product_data['quantity_in_ml']:
-                raise InsufficientStockError(
-                    product_data['product_id'],
-                    available_product.quantity_in_ml,
-                    product_data['quantity_in_ml']
+            product_id = product_data['product_id']
+            requested[product_id] = requested.get(product_id, 0) + product_data['quantity_in_ml']
+        return requested
+
+    @staticmethod
+    def _apply_conditional_update(requested: Dict[int, int], assignment: str) -> List[AvailableProduct]:
+        """Aplica assignment às linhas de hoje ou levanta o erro do primeiro produto sem estoque"""
+        if not requested:
+            return []
+
+        today = timezone.now().date()
+        sql = CONDITIONAL_STOCK_UPDATE_SQL.format(
+            table=connection.ops.quote_name(AvailableProduct._meta.db_table),
+            values=', '.join(['(%s::bigint, %s::integer)'] * len(requested)),
+            assignment=assignment,
+        )
+        params = [value for item in requested.items() for value in item] + [today]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = {row[0]: row[1:] for row in cursor.fetchall()}
+
+        for product_id, quantity in requested.items():
+            stock_id, available, _, _ = rows[product_id]
+            if stock_id is None:
+                raise StockNotFoundError(product_id)
+            if available < quantity:
+                raise InsufficientStockError(product_id, available, quantity)
+
+        updated_products = []
+        for product_id in requested:
+            stock_id, _, quantity_in_ml, reserved_in_ml = rows[product_id]
+            updated_products.append(AvailableProduct(
+                id=stock_id,
+                product_id=product_id,
+                quantity_in_ml=quantity_in_ml,
+                reserved_in_ml=reserved_in_ml,
+                date=today
+            ))
+
+        return updated_products
+
+    @staticmethod
+    def _apply_reserved_update(held: Dict[Tuple[int, date], int], assignment: str) -> List[AvailableProduct]:
+        """Aplica assignment às linhas de estoque que seguram as quantidades reservadas"""
+        if not held:
+            return []
+
+        sql = RESERVED_STOCK_UPDATE_SQL.format(
+            table=connection.ops.quote_name(AvailableProduct._meta.db_table),
+            values=', '.join(['(%s::bigint, %s::date, %s::integer)'] * len(held)),
+            assignment=assignment,
+        )
+        params = [
+            value
+            for (product_id, held_date), quantity in held.items()
+            for value in (product_id, held_date, quantity)
+        ]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [
+                AvailableProduct(
+                    id=stock_id,
+                    product_id=product_id,
+                    date=stock_date,
+                    quantity_in_ml=quantity_in_ml,
+                    reserved_in_ml=reserved_in_ml
                 )
+                for stock_id, product_id, stock_date, quantity_in_ml, reserved_in_ml in cursor.fetchall()
+            ]
+
+    @staticmethod
+    def _held_by_reservations(reservation_ids: List[int]) -> Tuple[Dict[Tuple[int, date], int], Dict[Tuple[int, date], int]]:
+        """Soma as quantidades reservadas por (produto, data), separando as que saíram dos slots"""
+        items = StockReservationItem.objects.filter(
+            reservation_id__in=reservation_ids
+        ).values('product_id', 'date', 'from_slots').annotate(total=Sum('quantity_in_ml')).order_by()
+
+        held_in_reserved, held_in_slots = {}, {}
+        for item in items:
+            held = held_in_slots if item['from_slots'] else held_in_reserved
+            held[(item['product_id'], item['date'])] = item['total']
+        return held_in_reserved, held_in_slots
+
+    @staticmethod
+    def _lock_active_reservation(reservation_id: int) -> StockReservation:
+        try:
+            reservation = StockReservation.objects.select_for_update().get(pk=reservation_id)
+        except StockReservation.DoesNotExist:
+            raise ReservationNotFoundError(reservation_id)
+
+        if reservation.status != StockReservation.ACTIVE:
+            raise ReservationNotActiveError(reservation_id, reservation.status)
+        return reservation
+
+    @staticmethod
+    @observed('consume_stock')
+    @transaction.atomic
+    def consume_stock(products_data: List[Dict], order_reference: Optional[str] = None) -> List[AvailableProduct]:
+        """Consome estoque dos produtos disponíveis numa única ida ao banco"""
+        requested = StockService._sum_by_product(products_data)
+        today = timezone.now().date()
+        updated_products = StockService._consume(requested, today)
+        StockService._record_movements(
+            [
+                (product_id, today, StockMovement.CONSUME, -quantity)
+                for product_id, quantity in requested.items()
+            ],
+            order_reference
+        )
+
+        StockService._publish_changes(updated_products.values(), today)
+        transaction.on_commit(get_availability_cache().invalidate)
+        return [updated_products[product_id] for product_id in requested]
+
+    @staticmethod
+    @observed('consume_stock_batch')
+    @transaction.atomic
+    def consume_stock_batch(requests: List[Tuple[List[Dict], Optional[str]]]) -> List:
+        """
+        Aplica vários consumos (products_data, order_reference) numa transação.
+        Devolve, na ordem de chegada, a lista de AvailableProduct de cada um
+        ou a StockException que ele receberia sozinho.
+        """
+        requested = [StockService._sum_by_product(products_data) for products_data, _ in requests]
+        today = timezone.now().date()
+
+        # Caso comum: a soma de todos cabe no estoque e sai num único update
+        total = {}
+        for quantities in requested:
+            for product_id, quantity in quantities.items():
+                total[product_id] = total.get(product_id, 0) + quantity
+        try:
+            with transaction.atomic():
+                updated_products = StockService._consume(total, today)
+            results = [
+                [updated_products[product_id] for product_id in quantities]
+                for quantities in requested
+            ]
+        except StockException:
+            # Algum pedido não cabe: um a um, na ordem de chegada, cada um no
+            # seu savepoint, para que só ele falhe. Na ordem de chegada as
+            # travas sairiam fora da ordem de product_id e o lote poderia
+            # entrar em deadlock com quem trava em ordem; por isso tudo o que
+            # o lote toca é travado antes, em ordem (as travas do savepoint
+            # desfeito acima já foram soltas).
+            StockService._lock_today(total, today)
+            results = []
+            for quantities in requested:
+                try:
+                    with transaction.atomic():
+                        updated_products = StockService._consume(quantities, today)
+                    results.append([updated_products[product_id] for product_id in quantities])
+                except StockException as exc:
+                    record_stock_error(exc)
+                    results.append(exc)
+
+        # Um lançamento por pedido atendido, com a referência de cada um
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                product_id=product_id,
+                date=today,
+                kind=StockMovement.CONSUME,
+                quantity_in_ml=-quantity,
+                order_reference=order_reference
+            )
+            for quantities, (_, order_reference), result in zip(requested, requests, results)
+            if not isinstance(result, Exception)
+            for product_id, quantity in quantities.items()
+        ])
+
+        StockService._publish_changes(
+            [
+                available_product
+                for result in results
+                if not isinstance(result, Exception)
+                for available_product in result
+            ],
+            today
+        )
+        transaction.on_commit(get_availability_cache().invalidate)
+        return results
+
+    @staticmethod
+    def _consume(requested: Dict[int, int], today: date) -> Dict[int, AvailableProduct]:
+        """Baixa as quantidades (já somadas por produto) e devolve as linhas atualizadas"""
+        regular, sharded = StockService._split_sharded(requested, today)
+        updated_products = {
+            available_product.product_id: available_product
+            for available_product in StockService._apply_conditional_update(regular, CONSUME_ASSIGNMENT)
+        }
+        updated_products.update(StockService._take_from_slots(sharded, today))
+        return updated_products
+
+    @staticmethod
+    @transaction.atomic
+    def reserve_stock(
+        products_data: List[Dict],
+        ttl_seconds: Optional[int] = None,
+        order_reference: Optional[str] = None
+    ) -> StockReservation:
+        """Segura estoque dos produtos por ttl_seconds sem consumi-lo"""
+        requested = StockService._sum_by_product(products_data)
+        today = timezone.now().date()
+        regular, sharded = StockService._split_sharded(requested, today)
+
+        StockService._publish_changes(
+            [
+                *StockService._apply_conditional_update(regular, RESERVE_ASSIGNMENT),
+                *StockService._take_from_slots(sharded, today).values(),
+            ],
+            today
+        )
+
+        ttl_seconds = ttl_seconds or settings.STOCK_RESERVATION_TTL_SECONDS
+        reservation = StockReservation.objects.create(
+            expires_at=timezone.now() + timedelta(seconds=ttl_seconds),
+            order_reference=order_reference
+        )
+        StockReservationItem.objects.bulk_create([
+            StockReservationItem(
+                reservation=reservation,
+                product_id=product_id,
+                date=today,
+                quantity_in_ml=quantity,
+                from_slots=product_id in sharded
+            )
+            for product_id, quantity in requested.items()
+        ])
+
+        transaction.on_commit(get_availability_cache().invalidate)
+        return reservation
+
+    @staticmethod
+    @transaction.atomic
+    def confirm_reservation(reservation_id: int) -> List[AvailableProduct]:
+        """Transforma uma reserva ativa em consumo de estoque"""
+        reservation = StockService._lock_active_reservation(reservation_id)
+        if reservation.expires_at <= timezone.now():
+            raise ReservationNotActiveError(reservation_id, StockReservation.EXPIRED)
+
+        # O que saiu dos slots já está fora do saldo; só o reserved_in_ml precisa baixar
+        held_in_reserved, held_in_slots = StockService._held_by_reservations([reservation.pk])
+        updated_products = StockService._apply_reserved_update(held_in_reserved, COMMIT_RESERVED_ASSIGNMENT)
+        for held_date in {held_date for _, held_date in held_in_slots}:
+            updated_products.extend(StockService._slot_totals(
+                [product_id for product_id, slot_date in held_in_slots if slot_date == held_date],
+                held_date
+            ).values())
+
+        StockService._record_movements(
+            [
+                (product_id, held_date, StockMovement.CONSUME, -quantity)
+                for held in (held_in_reserved, held_in_slots)
+                for (product_id, held_date), quantity in sorted(held.items())
+            ],
+            reservation.order_reference
+        )
+
+        reservation.status = StockReservation.CONFIRMED
+        reservation.save(update_fields=['status'])
+
+        transaction.on_commit(get_availability_cache().invalidate)
+        return updated_products
+
+    @staticmethod
+    @transaction.atomic
+    def release_reservation(reservation_id: int) -> StockReservation:
+        """Devolve ao estoque as quantidades de uma reserva ativa"""
+        reservation = StockService._lock_active_reservation(reservation_id)
+
+        held_in_reserved, held_in_slots = StockService._held_by_reservations([reservation.pk])
+        StockService._release_held(held_in_reserved, held_in_slots)
+
+        reservation.status = StockReservation.RELEASED
+        reservation.save(update_fields=['status'])
 
-            available_product.quantity_in_ml -= product_data['quantity_in_ml']
-            available_product.save()
-            updated_products.append(available_product)
+        transaction.on_commit(get_availability_cache().invalidate)
+        return reservation
 
-        return updated_products 
\ No newline at end of file
+    @staticmethod
+    @transaction.atomic
+    def expire_reservations(batch_size: int = 1000) -> int:
+        """Devolve ao estoque, em lote, as reservas ativas já vencidas"""
+        reservation_ids = list(
+            StockReservation.objects.select_for_update(skip_locked=True).filter(
+                status=StockReservation.ACTIVE,
+                expires_at__lte=timezone.now()
+            ).order_by('expires_at').values_list('id', flat=True)[:batch_size]
+        )
+        if not reservation_ids:
+            return 0
+
+        held_in_reserved, held_in_slots = StockService._held_by_reservations(reservation_ids)
+        StockService._release_held(held_in_reserved, held_in_slots)
+        StockReservation.objects.filter(id__in=reservation_ids).update(
+            status=StockReservation.EXPIRED
+        )
+
+        transaction.on_commit(get_availability_cache().invalidate)
+        return len(reservation_ids)
+
+    @staticmethod
+    @transaction.atomic
+    def archive_availability(before: date, batch_size: int = 1000) -> int:
+        """Move para AvailableProductArchive um lote de dias anteriores a before"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _slot_sql(
+                    ARCHIVE_AVAILABILITY_SQL,
+                    archive_table=connection.ops.quote_name(AvailableProductArchive._meta.db_table)
+                ),
+                {'before': before, 'batch_size': batch_size}
+            )
+            return cursor.rowcount
+
+    # As escritas dependem de transaction.atomic e de select_for_update, que o
+    # ORM assíncrono não oferece; estas versões rodam a síncrona numa thread.
+
+    @staticmethod
+    async def aupdate_availability(products_data: List[Dict]) -> List[AvailableProduct]:
+        return await sync_to_async(StockService.update_availability)(products_data)
+
+    @staticmethod
+    async def aconsume_stock(products_data: List[Dict], order_reference: Optional[str] = None) -> List[AvailableProduct]:
+        return await sync_to_async(StockService.consume_stock)(products_data, order_reference)
+
+    @staticmethod
+    async def areserve_stock(
+        products_data: List[Dict],
+        ttl_seconds: Optional[int] = None,
+        order_reference: Optional[str] = None
+    ) -> StockReservation:
+        return await sync_to_async(StockService.reserve_stock)(products_data, ttl_seconds, order_reference)
+
+    @staticmethod
+    async def aconfirm_reservation(reservation_id: int) -> List[AvailableProduct]:
+        return await sync_to_async(StockService.confirm_reservation)(reservation_id)
+
+    @staticmethod
+    async def arelease_reservation(reservation_id: int) -> StockReservation:
+        return await sync_to_async(StockService.release_reservation)(reservation_id)
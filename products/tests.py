@@ -1,3 +1,627 @@
+from django.db import connection, transaction
+from django.db.models import Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .exceptions.stock_exceptions import InsufficientStockError, ReservationNotActiveError, StockNotFoundError
+from .models import (
+    AvailableProduct,
+    AvailableProductSlot,
+    IdempotencyKey,
+    Product,
+    ProductPrice,
+    StockMovement,
+    StockReservation
+)
+from .services.availability_cache import get_availability_cache
+from .services.catalog_service import CatalogService
+from .services.stock_service import StockService
 
-# Create your tests here.
+
+class ConsumeStockTests(TestCase):
+    def setUp(self):
+        self.caldo = Product.objects.create(name='Caldo de Feijão', description='')
+        self.sopa = Product.objects.create(name='Sopa de Legumes', description='')
+        self.sem_estoque = Product.objects.create(name='Canja', description='')
+        StockService.update_availability([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 1000},
+            {'product_id': self.sopa.pk, 'quantity_in_ml': 500},
+        ])
+
+    def quantity(self, product):
+        return AvailableProduct.objects.get(product=product).quantity_in_ml
+
+    def test_consume_stock(self):
+        updated = StockService.consume_stock([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 300},
+            {'product_id': self.sopa.pk, 'quantity_in_ml': 500},
+        ])
+
+        self.assertEqual(
+            [(row.product_id, row.quantity_in_ml) for row in updated],
+            [(self.caldo.pk, 700), (self.sopa.pk, 0)]
+        )
+        self.assertEqual(self.quantity(self.caldo), 700)
+        self.assertEqual(self.quantity(self.sopa), 0)
+
+    def test_consume_stock_reports_the_first_offending_product(self):
+        with self.assertRaises(InsufficientStockError) as raised:
+            StockService.consume_stock([
+                {'product_id': self.caldo.pk, 'quantity_in_ml': 100},
+                {'product_id': self.sopa.pk, 'quantity_in_ml': 600},
+                {'product_id': self.sem_estoque.pk, 'quantity_in_ml': 100},
+            ])
+        self.assertEqual(
+            (raised.exception.product_id, raised.exception.available, raised.exception.requested),
+            (self.sopa.pk, 500, 600)
+        )
+
+        with self.assertRaises(StockNotFoundError) as raised:
+            StockService.consume_stock([
+                {'product_id': self.sem_estoque.pk, 'quantity_in_ml': 100},
+                {'product_id': self.sopa.pk, 'quantity_in_ml': 600},
+            ])
+        self.assertEqual(raised.exception.product_id, self.sem_estoque.pk)
+
+        # Nada foi baixado, nem dos produtos com estoque suficiente
+        self.assertEqual(self.quantity(self.caldo), 1000)
+        self.assertEqual(self.quantity(self.sopa), 500)
+
+    def test_consume_stock_sums_duplicate_product_ids(self):
+        updated = StockService.consume_stock([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 300},
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 200},
+        ])
+
+        self.assertEqual([(row.product_id, row.quantity_in_ml) for row in updated], [(self.caldo.pk, 500)])
+        self.assertEqual(self.quantity(self.caldo), 500)
+
+        # Cada linha cabe sozinha, mas a soma não
+        with self.assertRaises(InsufficientStockError) as raised:
+            StockService.consume_stock([
+                {'product_id': self.sopa.pk, 'quantity_in_ml': 300},
+                {'product_id': self.sopa.pk, 'quantity_in_ml': 300},
+            ])
+        self.assertEqual(raised.exception.requested, 600)
+        self.assertEqual(self.quantity(self.sopa), 500)
+
+
+class AvailabilityCacheTests(TestCase):
+    def setUp(self):
+        self.caldo = Product.objects.create(name='Caldo de Feijão', description='')
+        with self.captureOnCommitCallbacks(execute=True):
+            StockService.update_availability([{'product_id': self.caldo.pk, 'quantity_in_ml': 1000}])
+        self.cache = get_availability_cache()
+
+    def available(self):
+        payload = StockService.get_available_products_payload()
+        return {item['product_id']: item['quantity_in_ml'] for item in payload['products']}[self.caldo.pk]
+
+    def test_write_invalidates_the_snapshot_on_commit(self):
+        self.assertEqual(self.available(), 1000)
+        version = self.cache.backend.get_version()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            StockService.consume_stock([{'product_id': self.caldo.pk, 'quantity_in_ml': 300}])
+            # Antes do commit o snapshot antigo continua valendo
+            self.assertEqual(self.cache.backend.get_version(), version)
+            self.assertEqual(self.available(), 1000)
+
+        for callback in callbacks:
+            callback()
+        self.assertGreater(self.cache.backend.get_version(), version)
+        self.assertEqual(self.available(), 700)
+
+    def test_rolled_back_write_keeps_the_snapshot(self):
+        self.assertEqual(self.available(), 1000)
+        version = self.cache.backend.get_version()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    StockService.consume_stock([{'product_id': self.caldo.pk, 'quantity_in_ml': 300}])
+                    raise RuntimeError
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.cache.backend.get_version(), version)
+        self.assertEqual(self.available(), 1000)
+
+
+class CatalogConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.caldo = Product.objects.create(name='Caldo de Feijão', description='')
+
+    def test_list_answers_304_for_the_current_etag(self):
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_list_answers_304_for_last_modified(self):
+        response = self.client.get(reverse('product-list'))
+
+        response = self.client.get(reverse('product-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_answers_304_for_the_current_etag(self):
+        url = reverse('product-detail', args=[self.caldo.pk])
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_catalog_writes_change_the_etag(self):
+        etag = self.client.get(reverse('product-list'))['ETag']
+        writes = [
+            lambda: self.client.post(reverse('product-list'), {'name': 'Canja', 'description': 'Frango desfiado'}, format='json'),
+            lambda: self.client.patch(reverse('product-detail', args=[self.caldo.pk]), {'name': 'Caldo'}, format='json'),
+            lambda: self.client.delete(reverse('product-detail', args=[self.caldo.pk])),
+        ]
+
+        for write in writes:
+            self.assertLess(write().status_code, 300)
+            response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+
+
+class ProductListTests(APITestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=name, description='', prices=prices)
+            for name, prices in [
+                ('Caldo de Feijão', [{'size_ml': 300, 'price_in_cents': 1200}, {'size_ml': 500, 'price_in_cents': 1800}]),
+                ('Caldo Verde', [{'size_ml': 500, 'price_in_cents': 2200}]),
+                ('Sopa de Legumes', [{'size_ml': 300, 'price_in_cents': 1000}]),
+                ('Canja', [{'size_ml': 500, 'price_in_cents': 1500}]),
+                ('Mocotó', []),
+            ]
+        ]
+        CatalogService.sync_prices(self.products)
+
+    def names(self, **params):
+        response = self.client.get(reverse('product-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['name'] for product in response.data['results']]
+
+    def test_cursor_pagination_walks_the_catalog_by_id(self):
+        response = self.client.get(reverse('product-list'), {'page_size': 2})
+        pages = [[product['id'] for product in response.data['results']]]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append([product['id'] for product in response.data['results']])
+
+        ids = [product.pk for product in self.products]
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:]])
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_name_filter_matches_the_prefix(self):
+        self.assertEqual(self.names(name='caldo'), ['Caldo de Feijão', 'Caldo Verde'])
+        self.assertEqual(self.names(name='verde'), [])
+
+    def test_price_filters(self):
+        self.assertEqual(self.names(size_ml=300), ['Caldo de Feijão', 'Sopa de Legumes'])
+        self.assertEqual(self.names(max_price_in_cents=1500), ['Caldo de Feijão', 'Sopa de Legumes', 'Canja'])
+        # Tamanho e preço valem para o mesmo preço do produto
+        self.assertEqual(self.names(size_ml=500, max_price_in_cents=1800), ['Caldo de Feijão', 'Canja'])
+
+    def test_available_today_filter(self):
+        caldo, verde, sopa = self.products[:3]
+        StockService.update_availability([
+            {'product_id': caldo.pk, 'quantity_in_ml': 1000},
+            {'product_id': verde.pk, 'quantity_in_ml': 0},
+            {'product_id': sopa.pk, 'quantity_in_ml': 300},
+        ])
+        StockService.reserve_stock([{'product_id': sopa.pk, 'quantity_in_ml': 300}])
+
+        self.assertEqual(self.names(available_today='true'), ['Caldo de Feijão'])
+
+    def test_invalid_integer_filter_is_rejected(self):
+        response = self.client.get(reverse('product-list'), {'size_ml': 'grande'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductBulkTests(APITestCase):
+    def setUp(self):
+        self.caldo = Product.objects.create(name='Caldo de Feijão', description='Com bacon')
+        self.sopa = Product.objects.create(name='Sopa de Legumes', description='Sem carne')
+
+    def bulk_patch(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse('product-bulk-update'), data, format='json')
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "products_product"')]
+        return response, updates
+
+    def test_bulk_create(self):
+        response = self.client.post(reverse('product-list'), [
+            {'name': 'Canja', 'description': 'Frango', 'prices': [{'size_ml': 300, 'price_in_cents': 1000}]},
+            {'name': 'Mocotó', 'description': 'Tutano'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([product['name'] for product in response.data], ['Canja', 'Mocotó'])
+        self.assertTrue(all(product['id'] for product in response.data))
+        self.assertEqual(
+            list(ProductPrice.objects.filter(product__name='Canja').values_list('size_ml', 'price_in_cents')),
+            [(300, 1000)]
+        )
+
+    def test_bulk_update_writes_only_changed_products_and_fields(self):
+        response, updates = self.bulk_patch([
+            {'id': self.caldo.pk, 'name': 'Caldo de Feijão Tropeiro'},
+            {'id': self.sopa.pk, 'name': 'Sopa de Legumes', 'description': 'Sem carne'},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product['name'] for product in response.data], ['Caldo de Feijão Tropeiro', 'Sopa de Legumes'])
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"name"', updates[0])
+        self.assertNotIn('"description"', updates[0])
+        self.assertNotIn(f'= {self.sopa.pk})', updates[0])
+        self.caldo.refresh_from_db()
+        self.assertEqual(self.caldo.name, 'Caldo de Feijão Tropeiro')
+
+        response, updates = self.bulk_patch([{'id': self.sopa.pk, 'description': 'Sem carne'}])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(updates, [])
+
+    def test_bulk_update_rejects_unknown_repeated_and_missing_ids(self):
+        for data in (
+            [{'id': self.caldo.pk, 'name': 'Caldo'}, {'id': self.sopa.pk + 1000, 'name': 'Nada'}],
+            [{'id': self.caldo.pk, 'name': 'Caldo'}, {'id': self.caldo.pk, 'name': 'Caldo 2'}],
+            [{'id': self.caldo.pk, 'name': 'Caldo'}, {'name': 'Sem id'}],
+        ):
+            response, updates = self.bulk_patch(data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(updates, [])
+
+        self.caldo.refresh_from_db()
+        self.assertEqual(self.caldo.name, 'Caldo de Feijão')
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.caldo = Product.objects.create(name='Caldo de Feijão', description='')
+        self.sopa = Product.objects.create(name='Sopa de Legumes', description='')
+        StockService.update_availability([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 1000},
+            {'product_id': self.sopa.pk, 'quantity_in_ml': 500},
+        ])
+
+    def stock(self, product):
+        stock = AvailableProduct.objects.get(product=product)
+        return stock.quantity_in_ml, stock.reserved_in_ml, stock.available_in_ml
+
+    def test_reserved_stock_is_held_until_confirmed(self):
+        reservation = StockService.reserve_stock(
+            [{'product_id': self.caldo.pk, 'quantity_in_ml': 400}],
+            order_reference='pedido-1'
+        )
+        self.assertEqual(self.stock(self.caldo), (1000, 400, 600))
+
+        # O reservado não pode ser consumido por outro pedido
+        with self.assertRaises(InsufficientStockError) as raised:
+            StockService.consume_stock([{'product_id': self.caldo.pk, 'quantity_in_ml': 700}])
+        self.assertEqual(raised.exception.available, 600)
+
+        StockService.confirm_reservation(reservation.pk)
+
+        self.assertEqual(self.stock(self.caldo), (600, 0, 600))
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, StockReservation.CONFIRMED)
+        with self.assertRaises(ReservationNotActiveError):
+            StockService.confirm_reservation(reservation.pk)
+
+    def test_release_returns_the_reserved_stock(self):
+        reservation = StockService.reserve_stock([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 100},
+            {'product_id': self.sopa.pk, 'quantity_in_ml': 500},
+        ])
+        self.assertEqual(self.stock(self.sopa), (500, 500, 0))
+
+        StockService.release_reservation(reservation.pk)
+
+        self.assertEqual(self.stock(self.caldo), (1000, 0, 1000))
+        self.assertEqual(self.stock(self.sopa), (500, 0, 500))
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, StockReservation.RELEASED)
+        with self.assertRaises(ReservationNotActiveError):
+            StockService.release_reservation(reservation.pk)
+
+    def test_reservation_fails_as_a_whole(self):
+        with self.assertRaises(InsufficientStockError) as raised:
+            StockService.reserve_stock([
+                {'product_id': self.caldo.pk, 'quantity_in_ml': 100},
+                {'product_id': self.sopa.pk, 'quantity_in_ml': 600},
+            ])
+
+        self.assertEqual(raised.exception.product_id, self.sopa.pk)
+        self.assertEqual(self.stock(self.caldo), (1000, 0, 1000))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_availability_cannot_drop_below_active_reservations(self):
+        StockService.reserve_stock([{'product_id': self.caldo.pk, 'quantity_in_ml': 300}])
+
+        response = self.client.post(
+            reverse('available-products'),
+            {'products': [{'product_id': self.caldo.pk, 'quantity_in_ml': 200}]},
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            response.json()['error']['details'],
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 200, 'reserved_in_ml': 300}
+        )
+        self.assertEqual(self.stock(self.caldo), (1000, 300, 700))
+
+        # Cobrindo as reservas, a atualização passa
+        StockService.update_availability([{'product_id': self.caldo.pk, 'quantity_in_ml': 300}])
+        self.assertEqual(self.stock(self.caldo), (300, 300, 0))
+
+    def test_expired_reservations_are_released(self):
+        reservation = StockService.reserve_stock([{'product_id': self.caldo.pk, 'quantity_in_ml': 300}])
+        StockReservation.objects.filter(pk=reservation.pk).update(expires_at=timezone.now())
+
+        with self.assertRaises(ReservationNotActiveError):
+            StockService.confirm_reservation(reservation.pk)
+        self.assertEqual(StockService.expire_reservations(), 1)
+
+        self.assertEqual(self.stock(self.caldo), (1000, 0, 1000))
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, StockReservation.EXPIRED)
+
+
+class ShardedStockTests(TestCase):
+    def setUp(self):
+        self.mocoto = Product.objects.create(name='Mocotó', description='', stock_slots=4)
+        StockService.update_availability([{'product_id': self.mocoto.pk, 'quantity_in_ml': 1000}])
+
+    def available(self):
+        return AvailableProduct.objects.with_slot_totals().get(product=self.mocoto).available_in_ml
+
+    def slots(self):
+        return sorted(
+            AvailableProductSlot.objects.filter(
+                available_product__product=self.mocoto
+            ).values_list('quantity_in_ml', flat=True)
+        )
+
+    def test_availability_is_split_across_the_slots(self):
+        self.assertEqual(self.slots(), [250, 250, 250, 250])
+
+        StockService.update_availability([{'product_id': self.mocoto.pk, 'quantity_in_ml': 1002}])
+
+        self.assertEqual(self.slots(), [250, 250, 251, 251])
+        self.assertEqual(self.available(), 1002)
+
+    def test_consume_takes_from_a_single_slot(self):
+        updated = StockService.consume_stock([{'product_id': self.mocoto.pk, 'quantity_in_ml': 200}])
+
+        self.assertEqual(updated[0].available_in_ml, 800)
+        self.assertEqual(self.slots(), [50, 250, 250, 250])
+
+    def test_consume_falls_back_to_redistributing_the_slots(self):
+        # Nenhum slot tem 600 sozinho: os quatro são somados e redistribuídos
+        updated = StockService.consume_stock([{'product_id': self.mocoto.pk, 'quantity_in_ml': 600}])
+
+        self.assertEqual(updated[0].available_in_ml, 400)
+        self.assertEqual(self.slots(), [100, 100, 100, 100])
+
+        with self.assertRaises(InsufficientStockError) as raised:
+            StockService.consume_stock([{'product_id': self.mocoto.pk, 'quantity_in_ml': 500}])
+        self.assertEqual((raised.exception.available, raised.exception.requested), (400, 500))
+        self.assertEqual(self.slots(), [100, 100, 100, 100])
+
+    def test_reservations_come_out_of_the_slots(self):
+        reservation = StockService.reserve_stock([{'product_id': self.mocoto.pk, 'quantity_in_ml': 600}])
+        self.assertEqual(self.available(), 400)
+
+        # Redefinir o dia redistribui só o que as reservas não seguram
+        StockService.update_availability([{'product_id': self.mocoto.pk, 'quantity_in_ml': 1000}])
+        self.assertEqual(self.slots(), [100, 100, 100, 100])
+
+        StockService.release_reservation(reservation.pk)
+        self.assertEqual(self.available(), 1000)
+        self.assertEqual(sum(self.slots()), 1000)
+
+        reservation = StockService.reserve_stock([{'product_id': self.mocoto.pk, 'quantity_in_ml': 300}])
+        StockService.confirm_reservation(reservation.pk)
+        self.assertEqual(self.available(), 700)
+        self.assertEqual(sum(self.slots()), 700)
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.caldo = Product.objects.create(name='Caldo de Feijão', description='')
+        self.mocoto = Product.objects.create(name='Mocotó', description='', stock_slots=4)
+        StockService.update_availability([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 1000},
+            {'product_id': self.mocoto.pk, 'quantity_in_ml': 1000},
+        ])
+
+    def movements(self, **filters):
+        return sorted(StockMovement.objects.filter(**filters).values_list('product_id', 'kind', 'quantity_in_ml'))
+
+    def test_each_stock_change_writes_a_movement(self):
+        self.assertEqual(self.movements(), sorted([
+            (self.caldo.pk, StockMovement.RESTOCK, 1000),
+            (self.mocoto.pk, StockMovement.RESTOCK, 1000),
+        ]))
+
+        StockService.consume_stock([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 300},
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 200},
+        ], 'pedido-1')
+        self.assertEqual(self.movements(order_reference='pedido-1'), [(self.caldo.pk, StockMovement.CONSUME, -500)])
+
+        # Reservar e devolver não movimentam o livro; confirmar, sim
+        released = StockService.reserve_stock([{'product_id': self.caldo.pk, 'quantity_in_ml': 100}])
+        StockService.release_reservation(released.pk)
+        confirmed = StockService.reserve_stock([{'product_id': self.mocoto.pk, 'quantity_in_ml': 100}], order_reference='pedido-2')
+        StockService.confirm_reservation(confirmed.pk)
+        self.assertEqual(self.movements(order_reference='pedido-2'), [(self.mocoto.pk, StockMovement.CONSUME, -100)])
+
+        StockService.update_availability([{'product_id': self.caldo.pk, 'quantity_in_ml': 450}])
+        self.assertEqual(
+            self.movements(kind=StockMovement.ADJUSTMENT),
+            [(self.caldo.pk, StockMovement.ADJUSTMENT, -50)]
+        )
+
+        # Um consumo recusado não deixa lançamento
+        with self.assertRaises(InsufficientStockError):
+            StockService.consume_stock([{'product_id': self.caldo.pk, 'quantity_in_ml': 1000}], 'pedido-3')
+        self.assertEqual(self.movements(order_reference='pedido-3'), [])
+
+    def test_ledger_matches_remaining_stock(self):
+        StockService.consume_stock([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 150},
+            {'product_id': self.mocoto.pk, 'quantity_in_ml': 600},
+        ])
+        confirmed = StockService.reserve_stock([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 200},
+            {'product_id': self.mocoto.pk, 'quantity_in_ml': 100},
+        ])
+        StockService.confirm_reservation(confirmed.pk)
+        StockService.update_availability([{'product_id': self.caldo.pk, 'quantity_in_ml': 900}])
+        StockService.reserve_stock([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 250},
+            {'product_id': self.mocoto.pk, 'quantity_in_ml': 50},
+        ])
+
+        # Saldo físico: livre mais o que as reservas ativas seguram
+        for product, on_hand in ((self.caldo, 900), (self.mocoto, 300)):
+            stock = AvailableProduct.objects.with_slot_totals().get(product=product)
+            held = product.reservation_items.filter(
+                reservation__status=StockReservation.ACTIVE
+            ).aggregate(total=Sum('quantity_in_ml'))['total']
+            self.assertEqual(stock.available_in_ml + held, on_hand)
+            self.assertEqual(
+                StockMovement.objects.filter(product=product).aggregate(total=Sum('quantity_in_ml'))['total'],
+                on_hand
+            )
+
+
+class IdempotentConsumeTests(APITestCase):
+    def setUp(self):
+        self.caldo = Product.objects.create(name='Caldo de Feijão', description='')
+        StockService.update_availability([{'product_id': self.caldo.pk, 'quantity_in_ml': 1000}])
+
+    def consume(self, quantity_in_ml, key):
+        return self.client.post(
+            reverse('consume-stock'),
+            {'products': [{'product_id': self.caldo.pk, 'quantity_in_ml': quantity_in_ml}]},
+            format='json',
+            HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def quantity(self):
+        return AvailableProduct.objects.get(product=self.caldo).quantity_in_ml
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.consume(300, 'caixa-1')
+        retry = self.consume(300, 'caixa-1')
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(self.quantity(), 700)
+        self.assertEqual(StockMovement.objects.filter(kind=StockMovement.CONSUME).count(), 1)
+
+        # Outra chave é outro consumo
+        self.assertEqual(self.consume(300, 'caixa-2').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.quantity(), 400)
+
+    def test_client_errors_are_replayed_too(self):
+        first = self.consume(5000, 'caixa-1')
+        StockService.update_availability([{'product_id': self.caldo.pk, 'quantity_in_ml': 9000}])
+        retry = self.consume(5000, 'caixa-1')
+
+        self.assertEqual(first.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(retry.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.quantity(), 9000)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.consume(300, 'caixa-1')
+        response = self.consume(400, 'caixa-1')
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(response.data['error']['type'], 'conflict')
+        self.assertEqual(response.data['error']['details'], {'idempotency_key': 'caixa-1'})
+        self.assertEqual(self.quantity(), 700)
+        self.assertEqual(IdempotencyKey.objects.get(key='caixa-1').status_code, status.HTTP_200_OK)
+
+    def test_key_length_is_validated(self):
+        response = self.consume(300, 'x' * 256)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.quantity(), 1000)
+
+
+class ConsumeStockBatchTests(TestCase):
+    def setUp(self):
+        self.caldo = Product.objects.create(name='Caldo de Feijão', description='')
+        self.mocoto = Product.objects.create(name='Mocotó', description='', stock_slots=4)
+        self.sem_estoque = Product.objects.create(name='Canja', description='')
+        StockService.update_availability([
+            {'product_id': self.caldo.pk, 'quantity_in_ml': 1000},
+            {'product_id': self.mocoto.pk, 'quantity_in_ml': 1000},
+        ])
+
+    def available(self, product):
+        return AvailableProduct.objects.with_slot_totals().get(product=product).available_in_ml
+
+    def consumed(self):
+        return sorted(
+            StockMovement.objects.filter(kind=StockMovement.CONSUME).values_list('order_reference', 'quantity_in_ml')
+        )
+
+    def test_batch_that_fits_is_applied_at_once(self):
+        results = StockService.consume_stock_batch([
+            ([{'product_id': self.caldo.pk, 'quantity_in_ml': 300}], 'pedido-1'),
+            ([
+                {'product_id': self.caldo.pk, 'quantity_in_ml': 200},
+                {'product_id': self.mocoto.pk, 'quantity_in_ml': 100},
+            ], 'pedido-2'),
+        ])
+
+        self.assertEqual([[row.product_id for row in result] for result in results], [
+            [self.caldo.pk],
+            [self.caldo.pk, self.mocoto.pk],
+        ])
+        self.assertEqual(self.available(self.caldo), 500)
+        self.assertEqual(self.available(self.mocoto), 900)
+        self.assertEqual(self.consumed(), [('pedido-1', -300), ('pedido-2', -200), ('pedido-2', -100)])
+
+    def test_request_that_does_not_fit_fails_alone(self):
+        results = StockService.consume_stock_batch([
+            ([{'product_id': self.caldo.pk, 'quantity_in_ml': 600}], 'pedido-1'),
+            ([{'product_id': self.caldo.pk, 'quantity_in_ml': 600}], 'pedido-2'),
+            ([{'product_id': self.sem_estoque.pk, 'quantity_in_ml': 100}], 'pedido-3'),
+            ([
+                {'product_id': self.caldo.pk, 'quantity_in_ml': 400},
+                {'product_id': self.mocoto.pk, 'quantity_in_ml': 700},
+            ], 'pedido-4'),
+        ])
+
+        # Na ordem de chegada: o segundo já não cabe depois do primeiro
+        self.assertEqual(results[0][0].quantity_in_ml, 400)
+        self.assertIsInstance(results[1], InsufficientStockError)
+        self.assertEqual(results[1].available, 400)
+        self.assertIsInstance(results[2], StockNotFoundError)
+        self.assertEqual([row.available_in_ml for row in results[3]], [0, 300])
+        self.assertEqual(self.available(self.caldo), 0)
+        self.assertEqual(self.available(self.mocoto), 300)
+        self.assertEqual(self.consumed(), [('pedido-1', -600), ('pedido-4', -700), ('pedido-4', -400)])
@@ -1,12 +1,36 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, AvailableProductsView, ConsumeStockView
+from .views import (
+    ProductViewSet,
+    AvailableProductsView,
+    ConsumeStockView,
+    ReserveStockView,
+    ConfirmReservationView,
+    ReleaseReservationView,
+    ExportProductsView,
+    ExportAvailabilityView,
+    SalesReportView,
+    available_products_cache_stats,
+    consume_batcher_stats
+)
+from .async_views import AsyncAvailableProductsView, AsyncProductDetailView, StockEventsView
 
 router = DefaultRouter()
 router.register('', ProductViewSet)
 
 urlpatterns = [
     path('available-products/', AvailableProductsView.as_view(), name='available-products'),
+    path('available-products/cache-stats/', available_products_cache_stats, name='available-products-cache-stats'),
     path('stock/consume/', ConsumeStockView.as_view(), name='consume-stock'),
+    path('stock/consume/batcher-stats/', consume_batcher_stats, name='consume-batcher-stats'),
+    path('stock/events/', StockEventsView.as_view(), name='stock-events'),
+    path('stock/reservations/', ReserveStockView.as_view(), name='reserve-stock'),
+    path('stock/reservations/<int:reservation_id>/confirm/', ConfirmReservationView.as_view(), name='confirm-reservation'),
+    path('stock/reservations/<int:reservation_id>/release/', ReleaseReservationView.as_view(), name='release-reservation'),
+    re_path(r'^export/products\.(?P<export_format>ndjson|csv)$', ExportProductsView.as_view(), name='export-products'),
+    re_path(r'^export/availability\.(?P<export_format>ndjson|csv)$', ExportAvailabilityView.as_view(), name='export-availability'),
+    path('reports/sales/', SalesReportView.as_view(), name='sales-report'),
+    path('async/available-products/', AsyncAvailableProductsView.as_view(), name='async-available-products'),
+    path('async/<int:pk>/', AsyncProductDetailView.as_view(), name='async-product-detail'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,28 +1,131 @@
+from datetime import date
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import AllowAny
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.utils.decorators import method_decorator
-from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.utils import no_body, swagger_auto_schema
 from drf_yasg import openapi
-from django.core.exceptions import ObjectDoesNotExist
-from django.db import transaction
-from .models import Product, AvailableProduct
+from core.db_router import replica_reads
+from .models import Product, ProductPrice, AvailableProduct
+from .pagination import ProductCursorPagination
+from .renderers import ORJSONRenderer
 from .serializers import (
     ProductSerializer, 
     AvailableProductInputSerializer,
     AvailableProductOutputSerializer,
-    ConsumeStockInputSerializer
+    ConsumeStockInputSerializer,
+    ReserveStockInputSerializer,
+    StockReservationSerializer,
+    SalesReportQuerySerializer,
+    SalesReportSerializer
 )
+from .services.stock_service import StockService
+from .services.availability_cache import get_availability_cache
+from .services.catalog_service import CatalogService
+from .services.export_service import ExportService
+from .services.sales_report_service import SalesReportService
+from .services.idempotency_service import IdempotencyService
+from .services.consume_batcher import get_consume_batcher
+
+
+def catalog_conditional_response(request, version, updated_at):
+    """Cabeçalhos de validação da versão do catálogo e o 304, se o cliente já a tem"""
+    headers = {
+        'ETag': f'W/"catalog-{version}"',
+        'Last-Modified': http_date(updated_at.timestamp()),
+    }
+    response = get_conditional_response(
+        request,
+        etag=headers['ETag'],
+        last_modified=int(updated_at.timestamp())
+    )
+    return headers, response
+
+
+class FastReadMixin:
+    """
+    Com fast_read, as leituras da view montam a resposta a partir de .values()
+    em vez de instanciar modelos e serializers, e o JSON sai pelo orjson.
+    """
+    fast_read = True
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if not self.fast_read:
+            return renderers
+        return [
+            ORJSONRenderer() if type(renderer) is JSONRenderer else renderer
+            for renderer in renderers
+        ]
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(FastReadMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        
+        params = self.request.query_params
+        
+        # Prefixo do nome (índice product_name_prefix_idx)
+        name = params.get('name')
+        if name:
+            queryset = queryset.filter(name__istartswith=name)
+        
+        # Produtos com preço para o tamanho e/ou até o valor informado
+        # (índice productprice_size_price_idx)
+        size_ml = self._int_param('size_ml')
+        max_price_in_cents = self._int_param('max_price_in_cents')
+        if size_ml is not None or max_price_in_cents is not None:
+            prices = ProductPrice.objects.filter(product=OuterRef('pk'))
+            if size_ml is not None:
+                prices = prices.filter(size_ml=size_ml)
+            if max_price_in_cents is not None:
+                prices = prices.filter(price_in_cents__lte=max_price_in_cents)
+            queryset = queryset.filter(Exists(prices))
+        
+        # Somente produtos com estoque hoje (índice único product/date)
+        if self._available_today():
+            queryset = queryset.filter(Exists(
+                AvailableProduct.objects.filter(
+                    product=OuterRef('pk'),
+                    date=timezone.now().date()
+                ).in_stock()
+            ))
+        
+        return queryset
+    
+    def _available_today(self):
+        return self.request.query_params.get('available_today') in ('1', 'true', 'True')
+    
+    def _int_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({name: [f'{name} must be an integer']})
     
     def create(self, request, *args, **kwargs):
         # Verifica se é uma lista ou um único objeto
@@ -43,8 +146,106 @@ class ProductViewSet(viewsets.ModelViewSet):
             headers=headers
         )
 
+    def list(self, request, *args, **kwargs):
+        action = self._fast_list if self.fast_read else super().list
+        if self._available_today():
+            # O estoque muda sem mudar a versão do catálogo, então o ETag do
+            # catálogo não serve de validador para este filtro
+            with replica_reads():
+                return action(request, *args, **kwargs)
+        return self._conditional_response(action, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        action = self._fast_retrieve if self.fast_read else super().retrieve
+        return self._conditional_response(action, request, *args, **kwargs)
+
+    def _fast_values(self):
+        # Os campos do ProductSerializer, na mesma ordem, direto do banco
+        return self.filter_queryset(self.get_queryset()).values(*ProductSerializer.Meta.fields)
+
+    def _fast_list(self, request, *args, **kwargs):
+        queryset = self._fast_values()
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(list(queryset))
+        return self.get_paginated_response(page)
+
+    def _fast_retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return Response(get_object_or_404(
+            self._fast_values(),
+            **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        ))
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        products = serializer.instance if isinstance(serializer.instance, list) else [serializer.instance]
+        CatalogService.sync_prices(products)
+        CatalogService.bump_version()
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        if 'prices' in serializer.validated_data:
+            CatalogService.sync_prices([serializer.instance])
+        CatalogService.bump_version()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        CatalogService.bump_version()
+
+    @action(detail=False, methods=['put', 'patch'], url_path='bulk')
+    def bulk_update(self, request, *args, **kwargs):
+        # Atualiza vários produtos de uma vez; cada item precisa trazer seu id
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of products']})
+        
+        product_ids = [
+            item['id'] for item in request.data
+            if isinstance(item, dict) and isinstance(item.get('id'), int)
+        ]
+        serializer = self.get_serializer(
+            list(Product.objects.filter(id__in=product_ids)),
+            data=request.data,
+            many=True,
+            partial=request.method == 'PATCH'
+        )
+        serializer.is_valid(raise_exception=True)
+        
+        with transaction.atomic():
+            serializer.save()
+            CatalogService.sync_prices([
+                product for product, attrs in zip(serializer.instance, serializer.validated_data)
+                if 'prices' in attrs
+            ])
+            CatalogService.bump_version()
+        
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='cheapest-by-size', pagination_class=None)
+    def cheapest_by_size(self, request, *args, **kwargs):
+        # Menor preço por tamanho, resolvido pelo banco via DISTINCT ON (size_ml)
+        return self._conditional_response(
+            lambda request: Response(CatalogService.cheapest_by_size()),
+            request
+        )
+
+    def _conditional_response(self, action, request, *args, **kwargs):
+        # Responde 304 pela versão do catálogo, sem consultar a tabela de produtos.
+        # As leituras do catálogo podem ir para uma réplica (core.db_router).
+        with replica_reads():
+            headers, response = catalog_conditional_response(request, *CatalogService.get_version())
+            if response is None:
+                response = action(request, *args, **kwargs)
+
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
 @method_decorator(csrf_exempt, name='dispatch')
-class AvailableProductsView(APIView):
+class AvailableProductsView(FastReadMixin, APIView):
     parser_classes = [JSONParser]
     permission_classes = [AllowAny]
     http_method_names = ['get', 'post']  # Explicitamente permitindo GET e POST
@@ -68,18 +269,8 @@ class AvailableProductsView(APIView):
         }
     )
     def get(self, request, *args, **kwargs):
-        # Pegar a data atual
-        today = timezone.now().date()
-        
-        # Buscar produtos disponíveis
-        available_products = AvailableProduct.objects.filter(
-            date=today,
-            quantity_in_ml__gt=0
-        ).select_related('product')
-        
-        # Serializar resposta
-        serializer = AvailableProductOutputSerializer({"products": list(available_products)})
-        return Response(serializer.data)
+        # Snapshot do dia, reconstruído só quando o estoque muda
+        return Response(StockService.get_available_products_payload(fast=self.fast_read))
 
     @swagger_auto_schema(
         operation_description="Update product availability for today",
@@ -112,6 +303,18 @@ class AvailableProductsView(APIView):
                     }
                 }
             ),
+            409: openapi.Response(
+                description="New quantity below what active reservations hold",
+                examples={
+                    "application/json": {
+                        "error": {
+                            "type": "conflict",
+                            "message": "Disponibilidade do produto 1 não pode ficar abaixo do reservado. Nova quantidade: 100ml, Reservado: 300ml",
+                            "details": {"product_id": 1, "quantity_in_ml": 100, "reserved_in_ml": 300}
+                        }
+                    }
+                }
+            ),
             500: openapi.Response(
                 description="Internal Server Error",
                 examples={
@@ -131,24 +334,10 @@ class AvailableProductsView(APIView):
         input_serializer = AvailableProductInputSerializer(data=request.data)
         input_serializer.is_valid(raise_exception=True)
         
-        # Pegar a data atual
-        today = timezone.now().date()
-        
-        # Criar ou atualizar disponibilidades
-        available_products = []
-        for product in input_serializer.validated_data['products']:
-            # Verificar se o produto existe
-            try:
-                product_obj = Product.objects.get(id=product['product_id'])
-            except Product.DoesNotExist:
-                raise ObjectDoesNotExist(f"Product with id {product['product_id']} does not exist")
-                
-            available_product, _ = AvailableProduct.objects.update_or_create(
-                product=product_obj,
-                date=today,
-                defaults={'quantity_in_ml': product['quantity_in_ml']}
-            )
-            available_products.append(available_product)
+        # Criar ou atualizar todas as disponibilidades numa única transação
+        available_products = StockService.update_availability(
+            input_serializer.validated_data['products']
+        )
         
         # Serializar resposta
         serializer = AvailableProductOutputSerializer({"products": available_products})
@@ -160,8 +349,20 @@ class ConsumeStockView(APIView):
     permission_classes = [AllowAny]
     
     @swagger_auto_schema(
-        operation_description="Consume stock from available products",
+        operation_description=(
+            "Consume stock from available products. With an Idempotency-Key header, "
+            "retries get the stored response of the first execution."
+        ),
         request_body=ConsumeStockInputSerializer,
+        manual_parameters=[
+            openapi.Parameter(
+                'Idempotency-Key',
+                openapi.IN_HEADER,
+                description="Unique key per consumption, reused on retries",
+                type=openapi.TYPE_STRING,
+                required=False
+            )
+        ],
         responses={
             200: AvailableProductOutputSerializer,
             400: openapi.Response(
@@ -204,45 +405,224 @@ class ConsumeStockView(APIView):
             )
         }
     )
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
+        # Com Idempotency-Key, repetições (ex.: depois de um timeout no caixa)
+        # recebem a resposta da primeira execução em vez de consumir de novo
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return self._consume(request)
+        if not 0 < len(key) <= 255:
+            raise ValidationError({'Idempotency-Key': ['Idempotency-Key must have 1 to 255 characters']})
+        return IdempotencyService.execute(
+            key,
+            IdempotencyService.fingerprint(request),
+            lambda: self._consume(request),
+            self.handle_exception
+        )
+    
+    def _consume(self, request):
         # Validar input
         input_serializer = ConsumeStockInputSerializer(data=request.data)
         input_serializer.is_valid(raise_exception=True)
         
-        today = timezone.now().date()
-        updated_products = []
-        
-        # Verificar e atualizar cada produto
-        for product_data in input_serializer.validated_data['products']:
-            try:
-                available_product = AvailableProduct.objects.select_for_update().get(
-                    product_id=product_data['product_id'],
-                    date=today
-                )
-                
-                # Verificar se há estoque suficiente
-                if available_product.quantity_in_ml < product_data['quantity_in_ml']:
-                    raise serializers.ValidationError({
-                        "error": {
-                            "type": "validation_error",
-                            "message": "Insufficient stock",
-                            "details": f"Product {product_data['product_id']} has insufficient stock. "
-                                     f"Available: {available_product.quantity_in_ml}ml, "
-                                     f"Requested: {product_data['quantity_in_ml']}ml"
-                        }
-                    })
-                
-                # Atualizar o estoque
-                available_product.quantity_in_ml -= product_data['quantity_in_ml']
-                available_product.save()
-                updated_products.append(available_product)
-                
-            except AvailableProduct.DoesNotExist:
-                raise ObjectDoesNotExist(
-                    f"No available stock found for product {product_data['product_id']}"
-                )
+        # Verificar e atualizar todos os produtos de uma vez (junto com os
+        # consumos simultâneos, se o batcher estiver ligado). Sob ASGI as views
+        # síncronas não se sobrepõem, então o lote seria sempre de um.
+        batcher = None if isinstance(request._request, ASGIRequest) else get_consume_batcher()
+        consume = batcher.consume if batcher is not None else StockService.consume_stock
+        updated_products = consume(
+            input_serializer.validated_data['products'],
+            input_serializer.validated_data.get('order_reference')
+        )
         
         # Serializar resposta
         serializer = AvailableProductOutputSerializer({"products": updated_products})
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ReserveStockView(APIView):
+    parser_classes = [JSONParser]
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_description="Hold stock for a limited time without consuming it",
+        request_body=ReserveStockInputSerializer,
+        responses={
+            201: StockReservationSerializer,
+            400: openapi.Response(description="Bad Request"),
+            404: openapi.Response(description="Stock not found"),
+            422: openapi.Response(description="Insufficient stock")
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        # Validar input
+        input_serializer = ReserveStockInputSerializer(data=request.data)
+        input_serializer.is_valid(raise_exception=True)
+        
+        reservation = StockService.reserve_stock(
+            input_serializer.validated_data['products'],
+            input_serializer.validated_data.get('ttl_seconds'),
+            input_serializer.validated_data.get('order_reference')
+        )
+        
+        serializer = StockReservationSerializer(reservation)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ConfirmReservationView(APIView):
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_description="Consume the stock held by an active reservation",
+        request_body=no_body,
+        responses={
+            200: AvailableProductOutputSerializer,
+            404: openapi.Response(description="Reservation not found"),
+            409: openapi.Response(description="Reservation is no longer active")
+        }
+    )
+    def post(self, request, reservation_id, *args, **kwargs):
+        updated_products = StockService.confirm_reservation(reservation_id)
+        
+        serializer = AvailableProductOutputSerializer({"products": updated_products})
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ReleaseReservationView(APIView):
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_description="Return the stock held by an active reservation",
+        request_body=no_body,
+        responses={
+            200: StockReservationSerializer,
+            404: openapi.Response(description="Reservation not found"),
+            409: openapi.Response(description="Reservation is no longer active")
+        }
+    )
+    def post(self, request, reservation_id, *args, **kwargs):
+        reservation = StockService.release_reservation(reservation_id)
+        
+        serializer = StockReservationSerializer(reservation)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+async def _aiter_chunks(chunks):
+    # Sob ASGI o Django juntaria um iterador síncrono inteiro antes de enviar;
+    # cada bloco é lido na thread da requisição, dona do cursor do servidor
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def streaming_export_response(request, name, export_format, rows, fields):
+    """Resposta que escreve as linhas exportadas à medida que o cursor as lê"""
+    chunks = ExportService.render(rows, fields, export_format)
+    if isinstance(request._request, ASGIRequest):
+        chunks = _aiter_chunks(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=ExportService.FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+    return response
+
+
+export_format_parameter = openapi.Parameter(
+    'export_format',
+    openapi.IN_PATH,
+    description="ndjson or csv",
+    type=openapi.TYPE_STRING,
+    enum=list(ExportService.FORMATS)
+)
+
+
+class ExportProductsView(APIView):
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_description="Stream the whole product catalog as NDJSON or CSV",
+        manual_parameters=[export_format_parameter],
+        responses={200: openapi.Response(description="One product per line")}
+    )
+    def get(self, request, export_format, *args, **kwargs):
+        return streaming_export_response(
+            request,
+            'products',
+            export_format,
+            ExportService.product_rows(),
+            ExportService.PRODUCT_FIELDS
+        )
+
+class ExportAvailabilityView(APIView):
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_description="Stream the availability history as NDJSON or CSV",
+        manual_parameters=[
+            export_format_parameter,
+            openapi.Parameter('start', openapi.IN_QUERY, description="First date (YYYY-MM-DD)", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+            openapi.Parameter('end', openapi.IN_QUERY, description="Last date (YYYY-MM-DD)", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE)
+        ],
+        responses={200: openapi.Response(description="One product/date per line")}
+    )
+    def get(self, request, export_format, *args, **kwargs):
+        return streaming_export_response(
+            request,
+            'availability',
+            export_format,
+            ExportService.availability_rows(self._date_param('start'), self._date_param('end')),
+            ExportService.AVAILABILITY_FIELDS
+        )
+    
+    def _date_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({name: [f'{name} must be a date (YYYY-MM-DD)']})
+
+class SalesReportView(FastReadMixin, APIView):
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_description=(
+            "ml sold per product per hour (or day), read only from the rollups "
+            "kept by the rollup_sales command. Defaults to the last 30 days."
+        ),
+        query_serializer=SalesReportQuerySerializer,
+        responses={200: SalesReportSerializer}
+    )
+    def get(self, request, *args, **kwargs):
+        query_serializer = SalesReportQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        query = query_serializer.validated_data
+        
+        with replica_reads():
+            results = SalesReportService.sales(
+                query['granularity'],
+                query['start'],
+                query['end'],
+                query.get('product_id')
+            )
+        return Response({
+            'granularity': query['granularity'],
+            'start': query['start'],
+            'end': query['end'],
+            'results': results,
+        })
+
+@api_view(['GET'])
+def available_products_cache_stats(request):
+    """
+    Contadores de acerto/erro do cache de produtos disponíveis deste worker.
+    """
+    return Response(get_availability_cache().stats())
+
+@api_view(['GET'])
+def consume_batcher_stats(request):
+    """
+    Tamanho dos lotes e espera dos consumos no batcher deste worker.
+    """
+    batcher = get_consume_batcher()
+    return Response({'enabled': batcher is not None, **(batcher.stats() if batcher is not None else {})})